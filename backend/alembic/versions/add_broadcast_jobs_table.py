@@ -0,0 +1,45 @@
+"""Add broadcast_jobs table for marketing broadcast progress
+
+Revision ID: add_broadcast_jobs_table
+Revises: add_clients_business_email_index
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_broadcast_jobs_table'
+down_revision = 'add_clients_business_email_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import inspect
+    
+    # The app's create_all() may already have created the table
+    inspector = inspect(op.get_bind())
+    if 'broadcast_jobs' in inspector.get_table_names():
+        return
+    
+    op.create_table(
+        'broadcast_jobs',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('business_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('template_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('total_count', sa.Integer(), nullable=True),
+        sa.Column('sent_count', sa.Integer(), nullable=True),
+        sa.Column('failed_count', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(op.f('ix_broadcast_jobs_business_id'), 'broadcast_jobs', ['business_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_broadcast_jobs_business_id'), table_name='broadcast_jobs')
+    op.drop_table('broadcast_jobs')
@@ -0,0 +1,34 @@
+"""Add covering indexes on client_products for broadcast filters
+
+Revision ID: add_client_products_indexes
+Revises: add_marketing_template_trgm_index
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_client_products_indexes'
+down_revision = 'add_marketing_template_trgm_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (client_id, product_id, quantity): per-client membership + quantity checks as index-only scans
+    op.create_index(
+        'ix_cp_cid_pid_qty', 'client_products', ['client_id', 'product_id', 'quantity'],
+        unique=False, if_not_exists=True
+    )
+    # (product_id, client_id) INCLUDE (quantity): "product_id IN (...) GROUP BY client_id" access pattern
+    op.create_index(
+        'ix_cp_pid_cid', 'client_products', ['product_id', 'client_id'],
+        unique=False, if_not_exists=True, postgresql_include=['quantity']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cp_pid_cid', table_name='client_products', if_exists=True)
+    op.drop_index('ix_cp_cid_pid_qty', table_name='client_products', if_exists=True)
@@ -0,0 +1,30 @@
+"""Add (business_id, email) index on clients
+
+Revision ID: add_clients_business_email_index
+Revises: add_clients_updated_at_index
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_clients_business_email_index'
+down_revision = 'add_clients_updated_at_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Broadcast recipient queries filter by business_id and group by email
+    op.create_index(
+        'ix_clients_business_email',
+        'clients',
+        ['business_id', 'email'],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_business_email', table_name='clients', if_exists=True)
@@ -0,0 +1,31 @@
+"""Add GIN index on clients.order_ids
+
+Revision ID: add_clients_order_ids_gin_index
+Revises: add_orders_list_indexes
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_clients_order_ids_gin_index'
+down_revision = 'add_orders_list_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Serves the orders list "has client" lookup: order_ids ?| array[yandex_order_ids]
+    op.create_index(
+        'ix_clients_order_ids_gin',
+        'clients',
+        ['order_ids'],
+        postgresql_using='gin',
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_order_ids_gin', table_name='clients', if_exists=True)
@@ -0,0 +1,30 @@
+"""Add (business_id, updated_at) index on clients
+
+Revision ID: add_clients_updated_at_index
+Revises: add_marketing_template_lookup_indexes
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_clients_updated_at_index'
+down_revision = 'add_marketing_template_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Serves the broadcast date filters: updated_at range scans within one business
+    op.create_index(
+        'ix_clients_business_updated_at',
+        'clients',
+        ['business_id', 'updated_at'],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_business_updated_at', table_name='clients', if_exists=True)
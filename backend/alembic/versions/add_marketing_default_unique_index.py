@@ -0,0 +1,40 @@
+"""Enforce one default marketing template per business with a partial unique index
+
+Revision ID: add_marketing_default_unique_index
+Revises: add_broadcast_jobs_table
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_marketing_default_unique_index'
+down_revision = 'add_broadcast_jobs_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep only the oldest default per business so the unique index can be built
+    op.execute("""
+        UPDATE marketing_email_templates SET is_default = FALSE
+        WHERE is_default AND id NOT IN (
+            SELECT MIN(id) FROM marketing_email_templates WHERE is_default GROUP BY business_id
+        )
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_mkt_default_per_business ON marketing_email_templates (business_id)
+        WHERE is_default
+    """)
+    # Superseded by the unique index above
+    op.execute("DROP INDEX IF EXISTS idx_mkt_tpl_default")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS uq_mkt_default_per_business")
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mkt_tpl_default ON marketing_email_templates (business_id)
+        WHERE is_default
+    """)
@@ -0,0 +1,36 @@
+"""Add name and default-template indexes on marketing_email_templates
+
+Revision ID: add_marketing_template_lookup_indexes
+Revises: add_client_products_indexes
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_marketing_template_lookup_indexes'
+down_revision = 'add_client_products_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Case-insensitive name lookups within a business don't need the trigram index
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mkt_tpl_name_lower ON marketing_email_templates
+        (business_id, lower(name))
+    """)
+    
+    # Partial index: each business has at most one default template, so this stays tiny
+    # while serving the "does a default template already exist" checks
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mkt_tpl_default ON marketing_email_templates (business_id)
+        WHERE is_default
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_mkt_tpl_default")
+    op.execute("DROP INDEX IF EXISTS idx_mkt_tpl_name_lower")
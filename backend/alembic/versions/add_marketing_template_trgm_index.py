@@ -0,0 +1,31 @@
+"""Add trigram index for marketing email template search
+
+Revision ID: add_marketing_template_trgm_index
+Revises: add_buyer_id_columns
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_marketing_template_trgm_index'
+down_revision = 'add_buyer_id_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # pg_trgm lets a GIN index serve LIKE/ILIKE '%term%' searches
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    
+    # Index the same expression the search endpoint filters on, so the planner can use it
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mkt_tpl_trgm ON marketing_email_templates
+        USING GIN ((lower(name || ' ' || subject || ' ' || body)) gin_trgm_ops)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_mkt_tpl_trgm")
@@ -0,0 +1,37 @@
+"""Add composite indexes for the orders list
+
+Revision ID: add_orders_list_indexes
+Revises: add_marketing_default_unique_index
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_orders_list_indexes'
+down_revision = 'add_marketing_default_unique_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_orders: WHERE business_id = ? [AND status = ?] ORDER BY created_at DESC
+    op.create_index(
+        'ix_orders_business_created_at',
+        'orders',
+        ['business_id', 'created_at'],
+        if_not_exists=True
+    )
+    op.create_index(
+        'ix_orders_business_status_created_at',
+        'orders',
+        ['business_id', 'status', 'created_at'],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_business_status_created_at', table_name='orders', if_exists=True)
+    op.drop_index('ix_orders_business_created_at', table_name='orders', if_exists=True)
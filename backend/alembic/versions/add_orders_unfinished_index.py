@@ -0,0 +1,30 @@
+"""Add partial index on orders for the "unfinished" orders-list filter
+
+Revision ID: add_orders_unfinished_index
+Revises: add_orders_yandex_page_index
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_orders_unfinished_index'
+down_revision = 'add_orders_yandex_page_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_orders?status=unfinished pages by Yandex order over the non-FINISHED rows only
+    # (the enum column stores member names, hence 'FINISHED')
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_orders_business_unfinished_yandex_created_at
+        ON orders (business_id, yandex_order_id, created_at)
+        WHERE status <> 'FINISHED'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_orders_business_unfinished_yandex_created_at")
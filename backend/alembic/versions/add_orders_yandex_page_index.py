@@ -0,0 +1,30 @@
+"""Add (business_id, yandex_order_id, created_at) index on orders
+
+Revision ID: add_orders_yandex_page_index
+Revises: add_clients_order_ids_gin_index
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_orders_yandex_page_index'
+down_revision = 'add_clients_order_ids_gin_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_orders pages by Yandex order: GROUP BY yandex_order_id with MAX(created_at) per business
+    op.create_index(
+        'ix_orders_business_yandex_created_at',
+        'orders',
+        ['business_id', 'yandex_order_id', 'created_at'],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_business_yandex_created_at', table_name='orders', if_exists=True)
@@ -0,0 +1,30 @@
+"""Add (business_id, id) index on products
+
+Revision ID: add_products_business_id_index
+Revises: add_orders_unfinished_index
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_products_business_id_index'
+down_revision = 'add_orders_unfinished_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_products lists a business's products ordered by id (keyset pagination with after_id)
+    op.create_index(
+        'ix_products_business_id_id',
+        'products',
+        ['business_id', 'id'],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_business_id_id', table_name='products', if_exists=True)
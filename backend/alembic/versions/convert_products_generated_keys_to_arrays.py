@@ -0,0 +1,31 @@
+"""Store products.generated_keys as JSONB arrays instead of JSON-encoded strings
+
+Revision ID: convert_products_generated_keys_to_arrays
+Revises: add_products_business_id_index
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'convert_products_generated_keys_to_arrays'
+down_revision = 'add_products_business_id_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Older code wrote json.dumps(list) into the JSONB column, which stored a JSON string
+    # scalar; unwrap those into the array they encode
+    op.execute("""
+        UPDATE products
+        SET generated_keys = (generated_keys #>> '{}')::jsonb
+        WHERE jsonb_typeof(generated_keys) = 'string'
+    """)
+
+
+def downgrade() -> None:
+    # Arrays are valid for the old code as well (it accepted both forms)
+    pass
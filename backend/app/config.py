@@ -25,6 +25,17 @@ class Settings(BaseSettings):
     
     # Public URL for media files (used when uploading to Yandex)
     PUBLIC_URL: str = "http://localhost:8000"
+    
+    # Internal nginx location that serves the media directory (e.g. "/protected-media").
+    # When set, media downloads are handed to nginx via X-Accel-Redirect instead of streamed by the app
+    MEDIA_X_ACCEL_PREFIX: str = ""
+    
+    # Development aid: make list queries raise on any unplanned lazy load (relationship or
+    # deferred column) instead of silently issuing one extra query per row
+    RAISE_ON_LAZY_LOAD: bool = False
+    
+    # Level for the app.* loggers (DEBUG shows per-request debug output such as template updates)
+    LOG_LEVEL: str = "INFO"
 
 
 settings = Settings()
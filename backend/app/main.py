@@ -10,12 +10,32 @@ from app.services.yandex_api import YandexMarketAPI
 from app.services.review_checker import review_checker
 from app import models
 import asyncio
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor
 
 # Thread pool for running synchronous API calls
 executor = ThreadPoolExecutor(max_workers=2)
 
+def _start_app_logging() -> QueueListener:
+    """Route app.* loggers through a queue so request and broadcast threads never block on stderr.
+    
+    The QueueListener writes the records from its own thread; stop it on shutdown.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.addHandler(QueueHandler(log_queue))
+    app_logger.propagate = False
+    listener.start()
+    return listener
+
 def _is_digital_product(yandex_product_data: dict) -> bool:
     """
     Determine if a product is digital based on Yandex API response.
@@ -1132,6 +1152,11 @@ async def periodic_sync():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    log_listener = _start_app_logging()
+    
+    # Create media upload directories
+    media.ensure_media_dirs()
+    
     # Create database tables
     try:
         Base.metadata.create_all(bind=engine)
@@ -1566,6 +1591,9 @@ async def lifespan(app: FastAPI):
             pass
     # Business summary task removed
     # Business summary task removed
+    from app.services.yandex_api import close_http_client
+    close_http_client()
+    log_listener.stop()
 
 app = FastAPI(
     title="Yandex Market Digital Products Manager",
@@ -1589,6 +1617,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id"],  # Products list keyset cursor
 )
 
 # Include routers
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, Table, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, Table, UniqueConstraint, Index, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -27,7 +27,12 @@ class Product(Base):
         # Composite unique constraints: unique per business, not globally
         UniqueConstraint('business_id', 'yandex_market_id', name='uq_product_business_yandex_id'),
         UniqueConstraint('business_id', 'yandex_market_sku', name='uq_product_business_yandex_sku'),
+        # Products list: a business's products in id order (keyset pagination by id)
+        Index('ix_products_business_id_id', 'business_id', 'id'),
     )
+    # Fetch server-generated created_at/updated_at with RETURNING on INSERT/UPDATE, so a written
+    # product can be serialized without reloading the row
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     # Business isolation - links product to admin's business
@@ -222,6 +227,17 @@ class Order(Base):
         # Composite unique constraint: one Order record per (yandex_order_id, product_id) combination
         # This allows multiple Order records for the same Yandex order (one per product/item)
         UniqueConstraint('yandex_order_id', 'product_id', name='uq_order_yandex_product'),
+        # Orders list: newest first within a business, optionally filtered by status
+        # (btree indexes scan backwards, so ORDER BY created_at DESC needs no sort)
+        Index('ix_orders_business_created_at', 'business_id', 'created_at'),
+        Index('ix_orders_business_status_created_at', 'business_id', 'status', 'created_at'),
+        # Orders list paging by Yandex order: MAX(created_at) per yandex_order_id within a business
+        Index('ix_orders_business_yandex_created_at', 'business_id', 'yandex_order_id', 'created_at'),
+        # Same for the "unfinished" filter (status <> FINISHED); SQLEnum stores member names
+        Index(
+            'ix_orders_business_unfinished_yandex_created_at', 'business_id', 'yandex_order_id', 'created_at',
+            postgresql_where=text("status <> 'FINISHED'")
+        ),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -291,7 +307,10 @@ client_products = Table(
     Column('last_purchase_date', DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
     # Store all purchase dates for this product (JSON array of datetime strings)
     # Used to track history for -1 button functionality
-    Column('purchase_dates_history', JSONB, default=list)  # List of purchase date strings
+    Column('purchase_dates_history', JSONB, default=list),  # List of purchase date strings
+    # Covering indexes for the marketing broadcast filters (per-client and per-product lookups)
+    Index('ix_cp_cid_pid_qty', 'client_id', 'product_id', 'quantity'),
+    Index('ix_cp_pid_cid', 'product_id', 'client_id', postgresql_include=['quantity']),
 )
 
 
@@ -319,11 +338,24 @@ class Client(Base):
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        # Broadcast date filters: updated_at range within a business
+        Index('ix_clients_business_updated_at', 'business_id', 'updated_at'),
+        # Per-business client scans grouped/deduplicated by email (broadcast recipients)
+        Index('ix_clients_business_email', 'business_id', 'email'),
+        # Orders list "has client" check: order_ids ?| array[...] containment lookups
+        Index('ix_clients_order_ids_gin', 'order_ids', postgresql_using='gin'),
+    )
 
 
 class MarketingEmailTemplate(Base):
     """Email templates for marketing campaigns"""
     __tablename__ = "marketing_email_templates"
+    __table_args__ = (
+        # At most one default template per business, enforced by the database
+        Index('uq_mkt_default_per_business', 'business_id', unique=True, postgresql_where=text('is_default')),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     # Business isolation - links template to admin's business
@@ -348,6 +380,23 @@ class MarketingEmailTemplate(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class BroadcastJob(Base):
+    """Progress of a marketing email broadcast sent by a background task"""
+    __tablename__ = "broadcast_jobs"
+    
+    id = Column(String, primary_key=True)  # job_id returned by the broadcast endpoint
+    business_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    template_id = Column(Integer, nullable=False)  # No FK - the template may be deleted after sending
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed
+    total_count = Column(Integer, default=0)  # Recipients selected when the broadcast was queued
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)  # Set when status is failed
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class ChatReadStatus(Base):
     """Track when chat messages were last viewed for each order"""
     __tablename__ = "chat_read_status"
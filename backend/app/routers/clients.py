@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import text, or_ as sql_or, func
 from typing import List, Optional
 from datetime import datetime, timezone
@@ -9,14 +9,17 @@ from app.auth import get_current_active_user, has_permission, get_business_id
 
 router = APIRouter()
 
+# Built once at import so every call reuses the same statement (and its compiled form)
+PRODUCT_QUANTITY_SQL = text("""
+    SELECT quantity FROM client_products 
+    WHERE client_id = :client_id AND product_id = :product_id
+""")
+
 def _add_product_quantities(client, db):
     """Helper function to add product_quantities to a client object"""
     product_quantities = {}
     for product in client.purchased_products:
-        result = db.execute(text("""
-            SELECT quantity FROM client_products 
-            WHERE client_id = :client_id AND product_id = :product_id
-        """), {"client_id": client.id, "product_id": product.id})
+        result = db.execute(PRODUCT_QUANTITY_SQL, {"client_id": client.id, "product_id": product.id})
         row = result.first()
         if row:
             product_quantities[product.id] = row[0] or 1
@@ -38,7 +41,10 @@ def get_clients(
     from datetime import datetime
     
     business_id = get_business_id(current_user)
-    query = db.query(models.Client).filter(models.Client.business_id == business_id)
+    # purchased_products is read for every client below - load all collections in one IN query
+    query = db.query(models.Client).options(
+        selectinload(models.Client.purchased_products)
+    ).filter(models.Client.business_id == business_id)
     
     # Filter by product if provided
     if product_id is not None:
@@ -267,12 +267,6 @@ def get_recent_orders(
         
         # Get yandex_order_data to extract item IDs
         yandex_order_data = base_order.yandex_order_data or {}
-        if isinstance(yandex_order_data, str):
-            import json
-            try:
-                yandex_order_data = json.loads(yandex_order_data)
-            except:
-                yandex_order_data = {}
         
         # Extract items from yandex_order_data
         yandex_items = yandex_order_data.get("items", [])
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File,
 from fastapi.responses import Response, PlainTextResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from urllib.parse import quote, unquote
 import os
 import uuid
 from datetime import datetime
@@ -29,6 +30,20 @@ DOCUMENTATION_FILES_DIR.mkdir(parents=True, exist_ok=True)
 DOCUMENTATION_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 DOCUMENTATION_VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
 
+# URL prefix under which uploaded documentation files are served (see media router)
+MEDIA_URL_PREFIX = "/api/media/files/"
+
+
+def _encode_file_url(file_url: Optional[str]) -> Optional[str]:
+    """Percent-encode each path segment of a media file URL (other URLs are returned as is)"""
+    if not file_url or not file_url.startswith(MEDIA_URL_PREFIX):
+        return file_url
+    try:
+        segments = unquote(file_url.removeprefix(MEDIA_URL_PREFIX)).split('/')
+        return MEDIA_URL_PREFIX + '/'.join(quote(seg, safe='') for seg in segments)
+    except Exception:
+        return file_url  # If encoding fails, leave as-is
+
 
 @router.get("/", response_model=List[schemas.Documentation])
 def get_documentations(
@@ -37,8 +52,6 @@ def get_documentations(
     db: Session = Depends(get_db)
 ):
     """Get all documentations with optional search. Only returns documentations for the current user's business."""
-    from urllib.parse import quote, unquote
-    
     business_id = get_business_id(current_user)
     query = db.query(models.Documentation).filter(models.Documentation.business_id == business_id)
     if search:
@@ -48,15 +61,7 @@ def get_documentations(
     
     # Ensure file_url is properly encoded
     for doc in docs:
-        if doc.file_url and doc.file_url.startswith('/api/media/files/'):
-            path_part = doc.file_url.replace('/api/media/files/', '')
-            try:
-                decoded = unquote(path_part)
-                segments = decoded.split('/')
-                encoded = '/'.join(quote(seg, safe='') for seg in segments)
-                doc.file_url = f"/api/media/files/{encoded}"
-            except:
-                pass
+        doc.file_url = _encode_file_url(doc.file_url)
     
     return docs
 
@@ -93,7 +98,7 @@ async def create_documentation_from_file(
         counter += 1
     with open(file_path, "wb") as buffer:
         buffer.write(content)
-    file_url = f"/api/media/files/{relative_path}"
+    file_url = f"{MEDIA_URL_PREFIX}{relative_path}"
     name = base_name.replace("_", " ").strip() or original_filename
     business_id = get_business_id(current_user)
     db_documentation = models.Documentation(
@@ -111,22 +116,12 @@ async def create_documentation_from_file(
 @router.get("/{documentation_id}", response_model=schemas.Documentation)
 def get_documentation(documentation_id: int, db: Session = Depends(get_db)):
     """Get a single documentation by ID"""
-    from urllib.parse import quote, unquote
-    
     documentation = db.query(models.Documentation).filter(models.Documentation.id == documentation_id).first()
     if not documentation:
         raise HTTPException(status_code=404, detail="Documentation not found")
     
     # Ensure file_url is properly encoded
-    if documentation.file_url and documentation.file_url.startswith('/api/media/files/'):
-        path_part = documentation.file_url.replace('/api/media/files/', '')
-        try:
-            decoded = unquote(path_part)
-            segments = decoded.split('/')
-            encoded = '/'.join(quote(seg, safe='') for seg in segments)
-            documentation.file_url = f"/api/media/files/{encoded}"
-        except:
-            pass  # If encoding fails, leave as-is
+    documentation.file_url = _encode_file_url(documentation.file_url)
     
     return documentation
 
@@ -263,7 +258,7 @@ async def upload_documentation_file(
         buffer.write(content)
     
     # Return file URL - simple path, no encoding needed since we sanitized the filename
-    file_url = f"/api/media/files/{relative_path}"
+    file_url = f"{MEDIA_URL_PREFIX}{relative_path}"
     return {"file_url": file_url, "filename": filename}
 
 
@@ -304,7 +299,7 @@ def delete_documentation(
     
     # Delete file if it exists
     if db_documentation.file_url:
-        file_path = db_documentation.file_url.replace("/api/media/files/", "")
+        file_path = db_documentation.file_url.removeprefix(MEDIA_URL_PREFIX)
         full_path = os.path.join("uploads", file_path)
         if os.path.exists(full_path):
             os.remove(full_path)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
-from sqlalchemy import text, and_, or_ as sql_or, func
-from typing import List, Optional
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, BackgroundTasks
+from fastapi.responses import Response, ORJSONResponse
+from sqlalchemy.orm import Session, selectinload, raiseload, load_only
+from sqlalchemy import text, and_, func, select, bindparam
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Literal, Dict, Tuple
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import MappingProxyType
 from pydantic import BaseModel
 from app.database import get_db
 from app import models, schemas
@@ -14,19 +21,90 @@ from app.utils.export_utils import (
     build_pdf_bytes,
     strip_html,
 )
+from app.services.config_validator import ConfigurationError, format_config_error_response, validate_smtp_config
+from app.services.marketing_broadcast import (
+    send_broadcast,
+    send_default_broadcast,
+    get_template_cached,
+    invalidate_template_cache,
+    TEMPLATE_CACHE_TTL_SECONDS,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Look-back window and description for each relative broadcast date filter (read-only, built at import)
+DATE_DELTAS = MappingProxyType({
+    'last_month': timedelta(days=30),
+    'last_3_months': timedelta(days=90),
+    'last_6_months': timedelta(days=180),
+    'last_year': timedelta(days=365),
+})
+DATE_LABELS = MappingProxyType({
+    'last_month': 'last month',
+    'last_3_months': 'last 3 months',
+    'last_6_months': 'last 6 months',
+    'last_year': 'last year',
+})
+
+# Template list statements are built once at import; per request only the bound parameters change,
+# so SQLAlchemy's compiled cache is hit every time. Default templates are sorted first, then newest.
+TEMPLATES_LIST_STMT = select(models.MarketingEmailTemplate).where(
+    models.MarketingEmailTemplate.business_id == bindparam("business_id")
+).order_by(
+    models.MarketingEmailTemplate.is_default.desc(),
+    models.MarketingEmailTemplate.created_at.desc()
+)
+# Matches the idx_mkt_tpl_trgm expression index (pg_trgm GIN) so this avoids a sequential scan
+TEMPLATES_SEARCH_STMT = TEMPLATES_LIST_STMT.where(
+    text("lower(name || ' ' || subject || ' ' || body) ILIKE :q")
+)
+
+# Last purchase date of every (client, product) pair in a business (default-template broadcast)
+LAST_PURCHASE_DATES_SQL = text("""
+    SELECT cp.client_id, cp.product_id, cp.last_purchase_date FROM client_products cp
+    JOIN clients c ON c.id = cp.client_id
+    WHERE c.business_id = :business_id AND cp.last_purchase_date IS NOT NULL
+""")
+
+# Results of GET / per (business_id, search), as response models. Every endpoint that changes a
+# business's templates drops that business's entries in this process, and entries expire after
+# the TTL so other server processes pick up changes too (same as the broadcast template cache).
+TEMPLATE_LIST_CACHE_TTL_SECONDS = TEMPLATE_CACHE_TTL_SECONDS
+TEMPLATE_LIST_CACHE_MAX_SIZE = 1024
+_template_list_cache: Dict[Tuple[int, str], Tuple[float, list]] = {}
+_template_list_cache_lock = threading.Lock()
+
+
+def _invalidate_template_list_cache(business_id: int):
+    with _template_list_cache_lock:
+        for key in [key for key in _template_list_cache if key[0] == business_id]:
+            del _template_list_cache[key]
+
+# Rendered exports keyed by (template_id, last modified, format). A changed template has a new
+# timestamp, so stale entries are never hit and simply age out of the LRU.
+EXPORT_CACHE_MAX_SIZE = 32
+_export_cache: "OrderedDict[Tuple[int, Optional[datetime], str], bytes]" = OrderedDict()
+_export_cache_lock = threading.Lock()
 
 # Pydantic model for broadcast filters
 class BroadcastFilters(BaseModel):
     product_ids: Optional[List[int]] = None
-    date_filter: Optional[str] = None  # 'last_month', 'last_3_months', 'last_6_months', 'last_year', 'custom'
-    custom_start_date: Optional[str] = None  # ISO format date string
-    custom_end_date: Optional[str] = None  # ISO format date string
+    date_filter: Optional[Literal['last_month', 'last_3_months', 'last_6_months', 'last_year', 'custom']] = None
+    custom_start_date: Optional[date] = None  # YYYY-MM-DD (date input), inclusive
+    custom_end_date: Optional[date] = None  # YYYY-MM-DD (date input), inclusive
     min_product_quantity: Optional[int] = None  # Minimum quantity of specific product
     min_total_products: Optional[int] = None  # Minimum total number of different products bought
 
-@router.get("/", response_model=List[schemas.MarketingEmailTemplate])
+def _commit_template_change(db: Session):
+    """Commit a template insert/update; the uq_mkt_default_per_business index rejects a second default"""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="A default template already exists. Only one default template is allowed.")
+
+@router.get("/", response_model=List[schemas.MarketingEmailTemplate], response_class=ORJSONResponse)
 def get_marketing_templates(
     search: str = Query(None, description="Search by name, subject, or body"),
     current_user: models.User = Depends(get_current_active_user),
@@ -40,25 +118,26 @@ def get_marketing_templates(
             detail="Permission required: view_marketing_emails"
         )
     business_id = get_business_id(current_user)
-    query = db.query(models.MarketingEmailTemplate).filter(models.MarketingEmailTemplate.business_id == business_id)
+    cache_key = (business_id, search.lower() if search else "")
+    now = time.monotonic()
+    with _template_list_cache_lock:
+        entry = _template_list_cache.get(cache_key)
+    if entry and entry[0] > now:
+        return entry[1]
     
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.filter(
-            sql_or(
-                func.lower(models.MarketingEmailTemplate.name).like(search_term),
-                func.lower(models.MarketingEmailTemplate.subject).like(search_term),
-                func.lower(models.MarketingEmailTemplate.body).like(search_term)
-            )
-        )
-    
-    # Sort: default templates first, then by created_at descending
-    templates = query.order_by(
-        models.MarketingEmailTemplate.is_default.desc(),
-        models.MarketingEmailTemplate.created_at.desc()
-    ).all()
-    
-    return templates
+        templates = db.execute(
+            TEMPLATES_SEARCH_STMT, {"business_id": business_id, "q": f"%{search.lower()}%"}
+        ).scalars().all()
+    else:
+        templates = db.execute(TEMPLATES_LIST_STMT, {"business_id": business_id}).scalars().all()
+    
+    result = [schemas.MarketingEmailTemplate.model_validate(t) for t in templates]
+    with _template_list_cache_lock:
+        if len(_template_list_cache) >= TEMPLATE_LIST_CACHE_MAX_SIZE:
+            _template_list_cache.clear()
+        _template_list_cache[cache_key] = (now + TEMPLATE_LIST_CACHE_TTL_SECONDS, result)
+    return result
 
 @router.post("/", response_model=schemas.MarketingEmailTemplate)
 def create_marketing_template(
@@ -74,26 +153,18 @@ def create_marketing_template(
             detail="Permission required: view_marketing_emails"
         )
     business_id = get_business_id(current_user)
-    # Check if trying to create another default template when one already exists for this business
-    if template.is_default:
-        existing_default = db.query(models.MarketingEmailTemplate).filter(
-            models.MarketingEmailTemplate.business_id == business_id,
-            models.MarketingEmailTemplate.is_default == True
-        ).first()
-        if existing_default:
-            raise HTTPException(status_code=400, detail="A default template already exists. Only one default template is allowed.")
-    
     template_data = template.dict()
     template_data['business_id'] = business_id
     db_template = models.MarketingEmailTemplate(**template_data)
     db.add(db_template)
-    db.commit()
+    _commit_template_change(db)
     db.refresh(db_template)
+    _invalidate_template_list_cache(business_id)
     return db_template
 
 
 @router.post("/from-file", response_model=schemas.MarketingEmailTemplate, status_code=201)
-async def create_marketing_template_from_file(
+def create_marketing_template_from_file(
     file: UploadFile = File(...),
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db),
@@ -103,8 +174,8 @@ async def create_marketing_template_from_file(
         raise HTTPException(status_code=403, detail="Permission required: view_marketing_emails")
     if not file.filename or not file.filename.lower().endswith((".txt", ".pdf")):
         raise HTTPException(status_code=400, detail="Only .txt or .pdf files are allowed")
-    content = await file.read()
-    body_text = extract_text_from_file(content, file.filename)
+    # Parse straight from the upload's spooled temporary file instead of reading it into memory
+    body_text = extract_text_from_file(file.file, file.filename)
     if not body_text.strip():
         raise HTTPException(status_code=400, detail="File appears empty or could not extract text")
     import os
@@ -126,6 +197,7 @@ async def create_marketing_template_from_file(
     db.add(db_template)
     db.commit()
     db.refresh(db_template)
+    _invalidate_template_list_cache(business_id)
     return db_template
 
 
@@ -169,17 +241,27 @@ def export_marketing_template(
     ).first()
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
-    full_text = build_txt_marketing(template.name, template.subject or "", template.body or "")
     safe_name = "".join(c for c in template.name if c.isalnum() or c in " -_")[:80].strip() or "marketing-template"
+    cache_key = (template.id, template.updated_at or template.created_at, format)
+    with _export_cache_lock:
+        content = _export_cache.get(cache_key)
+        if content is not None:
+            _export_cache.move_to_end(cache_key)
+    if content is None:
+        full_text = build_txt_marketing(template.name, template.subject or "", template.body or "")
+        content = build_pdf_bytes(template.name, full_text) if format == "pdf" else full_text.encode("utf-8")
+        with _export_cache_lock:
+            _export_cache[cache_key] = content
+            while len(_export_cache) > EXPORT_CACHE_MAX_SIZE:
+                _export_cache.popitem(last=False)
     if format == "pdf":
-        pdf_bytes = build_pdf_bytes(template.name, full_text)
         return Response(
-            content=pdf_bytes,
+            content=content,
             media_type="application/pdf",
             headers={"Content-Disposition": f'attachment; filename="{safe_name}.pdf"'},
         )
     return Response(
-        content=full_text.encode("utf-8"),
+        content=content,
         media_type="text/plain; charset=utf-8",
         headers={"Content-Disposition": f'attachment; filename="{safe_name}.txt"'},
     )
@@ -199,8 +281,10 @@ def update_marketing_template(
             status_code=403,
             detail="Permission required: view_marketing_emails"
         )
+    business_id = get_business_id(current_user)
     template = db.query(models.MarketingEmailTemplate).filter(
-        models.MarketingEmailTemplate.id == template_id
+        models.MarketingEmailTemplate.id == template_id,
+        models.MarketingEmailTemplate.business_id == business_id
     ).first()
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
@@ -210,41 +294,33 @@ def update_marketing_template(
     update_data = template_update.dict(exclude_unset=True)
     
     # Debug: Log what we received
-    print(f"📥 Received update for template {template_id}: {list(update_data.keys())}")
+    logger.debug("Received update for template %s: %s", template_id, list(update_data.keys()))
     if 'attachments' in update_data:
-        print(f"📎 Attachments in update_data: {update_data['attachments']}")
+        logger.debug("Attachments in update_data: %s", update_data['attachments'])
     else:
-        print(f"⚠️  Attachments NOT in update_data")
+        logger.debug("Attachments NOT in update_data")
     
     # Explicitly handle attachments - always include if it was provided in the request
     # Pydantic's exclude_unset=True might exclude empty lists, so we check the raw input
     if hasattr(template_update, 'attachments'):
         # Attachments field exists in the model, include it in update
         update_data['attachments'] = template_update.attachments
-        print(f"✅ Including attachments: {template_update.attachments}")
-    
-    if update_data.get("is_default") and not template.is_default:
-        # Check if another default template exists for this business
-        existing_default = db.query(models.MarketingEmailTemplate).filter(
-            models.MarketingEmailTemplate.business_id == business_id,
-            models.MarketingEmailTemplate.is_default == True,
-            models.MarketingEmailTemplate.id != template_id
-        ).first()
-        if existing_default:
-            raise HTTPException(status_code=400, detail="A default template already exists. Only one default template is allowed.")
+        logger.debug("Including attachments: %s", template_update.attachments)
     
     # Debug logging
     if "attachments" in update_data:
-        print(f"📎 Updating template {template_id} attachments: {update_data['attachments']}")
+        logger.debug("Updating template %s attachments: %s", template_id, update_data['attachments'])
     
     for field, value in update_data.items():
         setattr(template, field, value)
     
-    db.commit()
+    _commit_template_change(db)
     db.refresh(template)
+    invalidate_template_cache(template_id)
+    _invalidate_template_list_cache(business_id)
     
     # Debug logging
-    print(f"✅ Template {template_id} updated. Attachments: {template.attachments}")
+    logger.debug("Template %s updated. Attachments: %s", template_id, template.attachments)
     
     return template
 
@@ -275,12 +351,55 @@ def delete_marketing_template(
     
     db.delete(template)
     db.commit()
+    invalidate_template_cache(template_id)
+    _invalidate_template_list_cache(business_id)
     return {"message": "Template deleted successfully"}
 
-@router.post("/{template_id}/broadcast")
-async def broadcast_marketing_email(
+def _default_broadcast_clients_query(db: Session, business_id: int):
+    """Clients of a business with the purchased products the default broadcast reads, in id order
+    
+    Only the columns the expiry check and render data read are loaded (skips order_ids and the
+    large Product JSONB columns such as yandex_full_data and generated_keys). Any other column or
+    relationship access raises instead of being a hidden per-client query.
+    """
+    return db.query(models.Client).options(
+        load_only(models.Client.id, models.Client.name, models.Client.email, raiseload=True),
+        selectinload(models.Client.purchased_products).options(
+            load_only(
+                models.Product.id,
+                models.Product.name,
+                models.Product.yandex_purchase_link,
+                models.Product.is_active,
+                models.Product.product_type,
+                models.Product.usage_period,
+                models.Product.email_template_id,
+                raiseload=True,
+            ),
+            raiseload('*'),
+        ),
+        raiseload('*'),
+    ).filter(
+        models.Client.business_id == business_id
+    ).order_by(models.Client.id)
+
+def _create_broadcast_job(db: Session, business_id: int, template_id: int, total_count: int) -> str:
+    """Record a queued broadcast so its progress can be polled; returns the job id"""
+    job_id = uuid.uuid4().hex
+    db.add(models.BroadcastJob(
+        id=job_id,
+        business_id=business_id,
+        template_id=template_id,
+        status="queued",
+        total_count=total_count
+    ))
+    db.commit()
+    return job_id
+
+@router.post("/{template_id}/broadcast", response_class=ORJSONResponse, status_code=202)
+def broadcast_marketing_email(
     template_id: int,
     filters: BroadcastFilters,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -288,6 +407,13 @@ async def broadcast_marketing_email(
     
     For default templates, generates unique emails per client based on expired subscriptions.
     Ensures no duplicate clients are created (checks by email).
+    
+    Recipients are selected here; the emails themselves are sent by a background task
+    after the response is returned, so the response reports queued (not delivered) counts.
+    Poll GET /broadcasts/{job_id} for the delivery result.
+    
+    Declared as a plain def so FastAPI runs it in its threadpool: the database session is
+    synchronous, and inside an async def every query would block the event loop.
     """
     # Check permission
     if not current_user.is_admin and not has_permission(current_user, "view_marketing_emails"):
@@ -295,29 +421,49 @@ async def broadcast_marketing_email(
             status_code=403,
             detail="Permission required: view_marketing_emails"
         )
-    import json
-    from sqlalchemy import text
     
-    # Get template
-    template = db.query(models.MarketingEmailTemplate).filter(
-        models.MarketingEmailTemplate.id == template_id
-    ).first()
-    if not template:
+    business_id = get_business_id(current_user)
+    
+    # Validate SMTP settings up front - sending happens after the response is returned
+    try:
+        validate_smtp_config(business_id, db)
+    except ConfigurationError as e:
+        raise HTTPException(status_code=400, detail=format_config_error_response(e))
+    
+    # Get template through the read-through cache (falls back to a primary key lookup);
+    # all reads below run in the request session's single transaction
+    template = get_template_cached(db, template_id)
+    if not template or template.business_id != business_id:
         raise HTTPException(status_code=404, detail="Template not found")
     
     # Handle default template broadcast differently
     if template.is_default:
         # Default template: generate unique emails per client based on expired subscriptions
-        business_id = get_business_id(current_user)
-        all_clients = db.query(models.Client).filter(models.Client.business_id == business_id).all()
-        clients_to_email = []
-        unique_emails = set()  # Track emails to prevent duplicates
+        # Last purchase date of every (client, product) pair in this business, in one query
+        last_purchase = {
+            (client_id, product_id): last_purchase_date
+            for client_id, product_id, last_purchase_date in db.execute(
+                LAST_PURCHASE_DATES_SQL, {"business_id": business_id}
+            )
+        }
         
-        for client in all_clients:
-            # Skip if email already processed (prevent duplicates)
-            if client.email in unique_emails:
-                continue
-            
+        # Activation template expiry periods of this business, in one query
+        activate_till_days = dict(
+            db.query(models.EmailTemplate.id, models.EmailTemplate.activate_till_days).filter(
+                models.EmailTemplate.business_id == business_id
+            ).all()
+        )
+        product_expiry_days = {}  # product id -> expiry period, resolved once per product
+        now_utc = datetime.now(timezone.utc)  # One reference time for the whole broadcast
+        
+        # Clients are streamed in batches of 200 (server-side cursor), so only one batch of
+        # Client objects and their products is in memory at a time
+        clients_query = _default_broadcast_clients_query(db, business_id).yield_per(200)
+        clients_processed = 0
+        used_emails = set()  # Emails already queued; marked only once a client actually qualifies
+        recipients = []
+        
+        for client in clients_query:
             expired_products = []
             
             # Check each product the client has purchased
@@ -326,42 +472,30 @@ async def broadcast_marketing_email(
                 if not product.yandex_purchase_link or not product.is_active:
                     continue
                 
-                # Get purchase history for this product
-                result = db.execute(text("""
-                    SELECT last_purchase_date, purchase_dates_history FROM client_products 
-                    WHERE client_id = :client_id AND product_id = :product_id
-                """), {"client_id": client.id, "product_id": product.id})
-                row = result.first()
-                
-                if not row or not row[0]:
+                # Get last purchase date for this product
+                last_purchase_date = last_purchase.get((client.id, product.id))
+                if not last_purchase_date:
                     continue
                 
-                last_purchase_date = row[0]
-                if last_purchase_date and last_purchase_date.tzinfo is None:
-                    last_purchase_date = last_purchase_date.replace(tzinfo=datetime.timezone.utc)
+                if last_purchase_date.tzinfo is None:
+                    last_purchase_date = last_purchase_date.replace(tzinfo=timezone.utc)
                 
                 # Determine expiry period
-                expiry_days = None
-                if product.product_type == models.ProductType.PHYSICAL:
+                if product.id in product_expiry_days:
+                    expiry_days = product_expiry_days[product.id]
+                elif product.product_type == models.ProductType.PHYSICAL:
                     # For physical products, use usage_period if available
-                    expiry_days = product.usage_period
+                    expiry_days = product_expiry_days[product.id] = product.usage_period
                 else:
                     # For digital products, use activation template expiry period
-                    if product.email_template_id:
-                        business_id = get_business_id(current_user)
-                        email_template = db.query(models.EmailTemplate).filter(
-                            models.EmailTemplate.id == product.email_template_id,
-                            models.EmailTemplate.business_id == business_id
-                        ).first()
-                        if email_template:
-                            expiry_days = email_template.activate_till_days
+                    expiry_days = product_expiry_days[product.id] = activate_till_days.get(product.email_template_id)
                 
                 if not expiry_days:
                     continue  # No expiry period defined, skip
                 
                 # Check if subscription has expired
                 expiry_date = last_purchase_date + timedelta(days=expiry_days)
-                if datetime.utcnow().replace(tzinfo=datetime.timezone.utc) > expiry_date:
+                if now_utc > expiry_date:
                     expired_products.append({
                         "product": product,
                         "last_purchase_date": last_purchase_date,
@@ -370,164 +504,116 @@ async def broadcast_marketing_email(
                     })
             
             # Only add client if they have expired products
-            if expired_products:
-                clients_to_email.append({
-                    "client": client,
-                    "expired_products": expired_products
-                })
-                unique_emails.add(client.email)  # Track email to prevent duplicates
-        
-        if not clients_to_email:
-            raise HTTPException(status_code=400, detail="No clients have expired subscriptions")
-        
-        # Send emails to clients with expired subscriptions
-        from app.services.email_service import EmailService
-        from jinja2 import Template as JinjaTemplate
-        from app.services.config_validator import ConfigurationError, format_config_error_response
-        email_service = EmailService(business_id=business_id, db=db)
-        
-        sent_count = 0
-        failed_count = 0
-        failed_emails = []
-        
-        for client_data in clients_to_email:
-            client = client_data["client"]
-            expired_products = client_data["expired_products"]
+            if not expired_products:
+                continue
             
             if not client.email:
-                print(f"⚠️  Skipping client {client.id} ({client.name}) - no email address")
+                logger.warning("Skipping client %s (%s) - no email address", client.id, client.name)
                 continue
             
-            # Generate unique email content for this client based on expired products
-            # Create a list of expired product names and purchase links
-            expired_product_list = []
-            for ep in expired_products:
-                product = ep["product"]
-                expired_product_list.append({
-                    "name": product.name,
-                    "purchase_link": product.yandex_purchase_link,
-                    "expired_date": ep["expiry_date"].strftime("%B %d, %Y") if ep.get("expiry_date") else "N/A"
-                })
-            
-            # Render template with client-specific data
-            jinja_template = JinjaTemplate(template.body)
-            email_body = jinja_template.render(
-                client_name=client.name,
-                expired_products=expired_product_list,
-                additional_info=template.body  # Include the template body as additional info
-            )
-            
-            # Send email
-            result = email_service.send_marketing_email(
-                to_email=client.email,
-                subject=template.subject,
-                body=email_body,
-                attachments=template.attachments if hasattr(template, 'attachments') and template.attachments else None
-            )
+            # One email per address: another client with the same email was already queued
+            if client.email in used_emails:
+                continue
+            clients_processed += 1
             
-            if result.get("success"):
-                sent_count += 1
-            else:
-                failed_count += 1
-                failed_emails.append(client.email)
-                print(f"⚠️  Failed to send email to {client.email}: {result.get('message', 'Unknown error')}")
+            # Keep only the per-client render data (emails are rendered and sent by a background
+            # task), so the Client objects of a processed batch can be released
+            recipients.append({
+                "email": client.email,
+                "name": client.name,
+                "expired_products": [
+                    {
+                        "name": ep["product"].name,
+                        "purchase_link": ep["product"].yandex_purchase_link,
+                        "expired_date": ep["expiry_date"].strftime("%B %d, %Y") if ep.get("expiry_date") else "N/A"
+                    }
+                    for ep in expired_products
+                ]
+            })
+            used_emails.add(client.email)
         
-        response_message = f"Default template broadcast completed: {sent_count} sent"
-        if failed_count > 0:
-            response_message += f", {failed_count} failed"
+        if not clients_processed:
+            raise HTTPException(status_code=400, detail="No clients have expired subscriptions")
+        
+        job_id = _create_broadcast_job(db, business_id, template_id, len(recipients))
+        background_tasks.add_task(send_default_broadcast, job_id, business_id, template_id, recipients)
         
         return {
-            "message": response_message,
-            "sent_count": sent_count,
-            "failed_count": failed_count,
-            "failed_emails": failed_emails if failed_count > 0 else [],
+            "message": f"Default template broadcast queued: {len(recipients)} recipients",
+            "job_id": job_id,
+            "sent_count": len(recipients),
             "template_id": template_id,
             "template_name": template.name,
             "filters_applied": ["expired subscriptions only"],
-            "clients_processed": len(clients_to_email),
-            "unique_emails": len(unique_emails)
+            "clients_processed": clients_processed,
+            "unique_emails": len(used_emails)
         }
     
     # Regular template broadcast (existing logic)
-    # Build query for clients - filter by business_id
-    business_id = get_business_id(current_user)
-    query = db.query(models.Client).filter(models.Client.business_id == business_id).distinct()
+    # Build query for recipient IDs - filter by business_id. One client per email address
+    # (prevent creating duplicate clients); the background task loads the clients it sends to.
+    stmt = select(func.min(models.Client.id).label("id")).select_from(models.Client).where(
+        models.Client.business_id == business_id
+    ).group_by(models.Client.email)
     filter_descriptions = []
     
-    # Apply product filter
+    # Apply product filter (EXISTS semi-join: stops at the first matching purchase per client)
     if filters.product_ids and len(filters.product_ids) > 0:
-        query = query.join(models.Client.purchased_products).filter(
-            models.Product.id.in_(filters.product_ids)
+        stmt = stmt.where(
+            select(1).select_from(models.client_products).where(
+                models.client_products.c.client_id == models.Client.id,
+                models.client_products.c.product_id.in_(filters.product_ids)
+            ).exists()
         )
         filter_descriptions.append(f"{len(filters.product_ids)} product(s)")
     
-    # Apply date filter
-    if filters.date_filter or (filters.custom_start_date and filters.custom_end_date):
-        # Calculate date range
-        end_date = datetime.utcnow()
-        start_date = None
-        
-        if filters.date_filter == 'last_month':
-            start_date = end_date - timedelta(days=30)
-            filter_descriptions.append("last month")
-        elif filters.date_filter == 'last_3_months':
-            start_date = end_date - timedelta(days=90)
-            filter_descriptions.append("last 3 months")
-        elif filters.date_filter == 'last_6_months':
-            start_date = end_date - timedelta(days=180)
-            filter_descriptions.append("last 6 months")
-        elif filters.date_filter == 'last_year':
-            start_date = end_date - timedelta(days=365)
-            filter_descriptions.append("last year")
-        elif filters.date_filter == 'custom' and filters.custom_start_date and filters.custom_end_date:
-            start_date = datetime.fromisoformat(filters.custom_start_date.replace('Z', '+00:00'))
-            end_date = datetime.fromisoformat(filters.custom_end_date.replace('Z', '+00:00'))
-            filter_descriptions.append(f"{start_date.date()} to {end_date.date()}")
-        
-        if start_date:
-            # Filter by updated_at (when client was last updated)
-            query = query.filter(models.Client.updated_at >= start_date)
-            query = query.filter(models.Client.updated_at <= end_date)
-    
-    # Get clients matching criteria so far
-    clients = query.all()
-    
-    # Ensure no duplicate emails (prevent creating duplicate clients)
-    unique_emails = set()
-    unique_clients = []
-    for client in clients:
-        if client.email not in unique_emails:
-            unique_clients.append(client)
-            unique_emails.add(client.email)
+    # Apply date filter - filter by updated_at (when client was last updated)
+    delta = DATE_DELTAS.get(filters.date_filter)
+    if delta:
+        # Relative windows are computed by the database: now() - interval
+        stmt = stmt.where(
+            models.Client.updated_at >= func.now() - delta,
+            models.Client.updated_at <= func.now()
+        )
+        filter_descriptions.append(DATE_LABELS[filters.date_filter])
+    elif filters.date_filter == 'custom' and filters.custom_start_date and filters.custom_end_date:
+        # Whole days: from the start of the first day to the end of the last
+        stmt = stmt.where(
+            models.Client.updated_at >= datetime.combine(filters.custom_start_date, dt_time.min),
+            models.Client.updated_at <= datetime.combine(filters.custom_end_date, dt_time.max)
+        )
+        filter_descriptions.append(f"{filters.custom_start_date} to {filters.custom_end_date}")
     
-    clients = unique_clients
+    if filters.min_total_products is not None:
+        # Filter clients who bought at least N different products (aggregated in SQL). Correlated
+        # to the outer client so only this business's clients are counted, each with an index-only
+        # scan of ix_cp_cid_pid_qty, instead of grouping client_products across every business.
+        distinct_products_bought = select(
+            func.count(func.distinct(models.client_products.c.product_id))
+        ).where(
+            models.client_products.c.client_id == models.Client.id
+        ).scalar_subquery()
+        stmt = stmt.where(distinct_products_bought >= filters.min_total_products)
+        filter_descriptions.append(f"{filters.min_total_products}+ different products")
     
-    # Apply quantity filters (these require raw SQL queries)
+    # Apply quantity filter
     if filters.min_product_quantity is not None and filters.product_ids:
         # Filter clients who bought at least N of any specified product
-        filtered_clients = []
-        for client in clients:
-            for product_id in filters.product_ids:
-                result = db.execute(text("""
-                    SELECT quantity FROM client_products 
-                    WHERE client_id = :client_id AND product_id = :product_id AND quantity >= :min_qty
-                """), {"client_id": client.id, "product_id": product_id, "min_qty": filters.min_product_quantity})
-                if result.scalar():
-                    filtered_clients.append(client)
-                    break
-        clients = filtered_clients
+        # (correlated EXISTS, served by the ix_cp_cid_pid_qty index)
+        stmt = stmt.where(
+            select(1).select_from(models.client_products).where(
+                models.client_products.c.client_id == models.Client.id,
+                models.client_products.c.product_id.in_(filters.product_ids),
+                models.client_products.c.quantity >= filters.min_product_quantity
+            ).exists()
+        )
         filter_descriptions.append(f"bought {filters.min_product_quantity}+ of selected products")
     
-    if filters.min_total_products is not None:
-        # Filter clients who bought at least N different products
-        filtered_clients = []
-        for client in clients:
-            if len(client.purchased_products) >= filters.min_total_products:
-                filtered_clients.append(client)
-        clients = filtered_clients
-        filter_descriptions.append(f"{filters.min_total_products}+ different products")
+    # Count recipients in SQL so an empty broadcast is rejected without fetching any rows
+    recipients = stmt.subquery()
+    sent_count = db.execute(select(func.count()).select_from(recipients)).scalar()
     
-    if not clients:
+    if not sent_count:
         # Provide more helpful error message
         if filters.product_ids and len(filters.product_ids) > 0:
             raise HTTPException(
@@ -545,48 +631,40 @@ async def broadcast_marketing_email(
                 detail="No clients match the criteria. Please check your filters or ensure you have clients in the system."
             )
     
-    # Send emails to all matching clients
-    from app.services.email_service import EmailService
-    from app.services.config_validator import ConfigurationError, format_config_error_response
-    email_service = EmailService(business_id=business_id, db=db)
+    # Recipient IDs for the background task, which loads the clients in chunks
+    client_ids = db.execute(select(recipients.c.id)).scalars().all()
     
-    sent_count = 0
-    failed_count = 0
-    failed_emails = []
-    
-    for client in clients:
-        if not client.email:
-            print(f"⚠️  Skipping client {client.id} ({client.name}) - no email address")
-            continue
-        
-        # Send email
-        result = email_service.send_marketing_email(
-            to_email=client.email,
-            subject=template.subject,
-            body=template.body,
-            attachments=template.attachments if hasattr(template, 'attachments') and template.attachments else None
-        )
-        
-        if result.get("success"):
-            sent_count += 1
-        else:
-            failed_count += 1
-            failed_emails.append(client.email)
-            print(f"⚠️  Failed to send email to {client.email}: {result.get('message', 'Unknown error')}")
-    
-    filter_msg = f" ({', '.join(filter_descriptions)})" if filter_descriptions else ""
-    
-    response_message = f"Email broadcast completed: {sent_count} sent"
-    if failed_count > 0:
-        response_message += f", {failed_count} failed"
+    # Queue emails to all matching clients
+    job_id = _create_broadcast_job(db, business_id, template_id, sent_count)
+    background_tasks.add_task(
+        send_broadcast, job_id, business_id, template_id, client_ids, filter_descriptions
+    )
     
     return {
-        "message": response_message,
+        "message": f"Email broadcast queued: {sent_count} recipients",
+        "job_id": job_id,
         "sent_count": sent_count,
-        "failed_count": failed_count,
-        "failed_emails": failed_emails if failed_count > 0 else [],
         "template_id": template_id,
         "template_name": template.name,
         "filters_applied": filter_descriptions,
-        "unique_emails": len(unique_emails)  # Confirm no duplicates
+        "unique_emails": sent_count  # One recipient per email address
     }
+
+@router.get("/broadcasts/{job_id}", response_model=schemas.BroadcastJob)
+def get_broadcast_job(
+    job_id: str,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a queued broadcast. Requires view_marketing_emails permission."""
+    # Check permission
+    if not current_user.is_admin and not has_permission(current_user, "view_marketing_emails"):
+        raise HTTPException(
+            status_code=403,
+            detail="Permission required: view_marketing_emails"
+        )
+    business_id = get_business_id(current_user)
+    job = db.get(models.BroadcastJob, job_id)
+    if not job or job.business_id != business_id:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return job
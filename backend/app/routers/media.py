@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple
+import asyncio
+import glob
+import gzip
+import mimetypes
 import os
+import re
 import shutil
 import uuid
+from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from urllib.parse import unquote
 from app.database import get_db
@@ -26,13 +33,61 @@ DOCUMENTATION_VIDEOS_DIR = MEDIA_DIR / "documentation" / "videos"
 MARKETING_FILES_DIR = MEDIA_DIR / "marketing" / "files"
 MARKETING_PHOTOS_DIR = MEDIA_DIR / "marketing" / "photos"
 
-# Create directories if they don't exist
-MEDIA_DIR.mkdir(exist_ok=True)
-DOCUMENTATION_FILES_DIR.mkdir(parents=True, exist_ok=True)
-DOCUMENTATION_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-DOCUMENTATION_VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
-MARKETING_FILES_DIR.mkdir(parents=True, exist_ok=True)
-MARKETING_PHOTOS_DIR.mkdir(parents=True, exist_ok=True)
+# Storage for upload_any_files: (context, kind) -> (attachment type, directory, URL-relative directory)
+_UPLOAD_TARGETS = {
+    ("documentation", "image"): ("image", DOCUMENTATION_IMAGES_DIR, "documentation/images"),
+    ("documentation", "video"): ("video", DOCUMENTATION_VIDEOS_DIR, "documentation/videos"),
+    ("documentation", "file"): ("file", DOCUMENTATION_FILES_DIR, "documentation/files"),
+    # Marketing: files and photos (images) - videos are stored as files
+    ("marketing", "image"): ("image", MARKETING_PHOTOS_DIR, "marketing/photos"),
+    ("marketing", "file"): ("file", MARKETING_FILES_DIR, "marketing/files"),
+}
+
+# Absolute media root used by the access checks (resolved once instead of per request)
+_MEDIA_ROOT = MEDIA_DIR.resolve()
+# String forms for the download path, which uses os.path instead of building Path objects
+_MEDIA_DIR_STR = str(MEDIA_DIR)
+_MEDIA_ROOT_STR = str(_MEDIA_ROOT)
+
+
+
+# Any run of characters outside [word . -], including existing underscores, collapses to one underscore
+_FILENAME_UNSAFE_RE = re.compile(r'(?:[^\w.\-]|_)+')
+
+# Browser/CDN caching for served media; revalidated with ETag / Last-Modified after expiry.
+# Not "immutable" because date-named uploads can reuse a name after the original is deleted
+MEDIA_CACHE_CONTROL = "public, max-age=86400"
+
+# Bytes read per chunk when streaming a partial (Range) response
+DOWNLOAD_CHUNK_SIZE = 1 << 18
+
+# Text-like uploads get a precompressed .gz copy served to clients that accept gzip
+# (text/* plus the types below; images, video and PDFs are already compressed)
+COMPRESSIBLE_MEDIA_TYPES = frozenset({
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "image/svg+xml",
+})
+# Files smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+# Size of the reusable buffer used when copying an upload to disk
+UPLOAD_CHUNK_SIZE = 1 << 18
+# Videos are large sequential copies, so they use a bigger buffer
+VIDEO_UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+def ensure_media_dirs():
+    """Create the media directories if they don't exist (called once at app startup)"""
+    for directory in (
+        DOCUMENTATION_FILES_DIR,
+        DOCUMENTATION_IMAGES_DIR,
+        DOCUMENTATION_VIDEOS_DIR,
+        MARKETING_FILES_DIR,
+        MARKETING_PHOTOS_DIR,
+    ):
+        directory.mkdir(parents=True, exist_ok=True)
 
 
 def get_media_url(file_path: str) -> str:
@@ -40,6 +95,168 @@ def get_media_url(file_path: str) -> str:
     return f"/api/media/files/{file_path}"
 
 
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse that hands the open file to the server when it supports zero-copy send
+    
+    By default (and under uvicorn, which does not advertise the extension) this behaves exactly
+    like FileResponse. Servers advertising the ASGI "http.response.zerocopysend" extension get
+    the file object itself and can sendfile() the body straight to the socket.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if "http.response.zerocopysend" not in scope.get("extensions", {}) or scope["method"].upper() == "HEAD":
+            await super().__call__(scope, receive, send)
+            return
+        if self.stat_result is None:
+            self.stat_result = os.stat(self.path)
+            self.set_stat_headers(self.stat_result)
+        with open(self.path, "rb") as file:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.zerocopysend", "file": file, "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def _reserve_file(target_dir: Path, base_name: str, ext: str) -> Path:
+    """Atomically create an empty file named base_name + ext, adding a random suffix if the name is taken"""
+    file_path = target_dir / f"{base_name}{ext}"
+    try:
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        file_path = target_dir / f"{base_name}_{uuid.uuid4().hex[:8]}{ext}"
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    os.close(fd)
+    return file_path
+
+
+def _is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Check the request's conditional headers against the file's ETag and modification time"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets
+    
+    Returns None for headers we don't handle (other units, multiple ranges, malformed),
+    in which case the whole file is sent. Raises 416 for ranges outside the file.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, sep, end_str = spec.strip().partition("-")
+    try:
+        if not sep:
+            return None
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_str), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    if start < 0 or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path: str, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a file"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _copy_upload(src, file_path: Path, bufsize: int):
+    """Copy an upload's spooled file to file_path
+    
+    Spools that rolled over to a real temp file are copied in the kernel with os.sendfile;
+    in-memory spools (or a failed sendfile) go through one reusable buffer instead of a new
+    bytes object per chunk.
+    """
+    with open(file_path, "wb") as dst:
+        if getattr(src, "_rolled", False) and hasattr(os, "sendfile"):
+            offset = start = src.tell()
+            try:
+                in_fd, out_fd = src.fileno(), dst.fileno()
+                while sent := os.sendfile(out_fd, in_fd, offset, bufsize):
+                    offset += sent
+                return
+            except OSError:
+                # Not supported for this pair of files - restart with the buffered copy
+                src.seek(start)
+                dst.seek(0)
+                dst.truncate()
+        buf = memoryview(bytearray(bufsize))
+        while n := src.readinto(buf):
+            dst.write(buf[:n])
+
+
+def _is_compressible(path) -> bool:
+    """Whether a file's type benefits from gzip (based on its extension)"""
+    media_type = mimetypes.guess_type(path)[0] or ""
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_MEDIA_TYPES
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (an explicit gzip entry wins over "*")
+    
+    Codings listed with q=0 are refused, e.g. "gzip;q=0" or "*;q=0".
+    """
+    qualities = {}
+    for entry in accept_encoding.split(","):
+        coding, *params = entry.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    if "gzip" in qualities:
+        return qualities["gzip"] > 0
+    return qualities.get("*", 0) > 0
+
+
+def _write_gzip_copy(file_path: Path):
+    """Write file_path.gz next to the file so downloads can be served precompressed"""
+    if os.path.getsize(file_path) < GZIP_MIN_SIZE:
+        return
+    with open(file_path, "rb") as src, gzip.open(f"{file_path}.gz", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+
+
+async def _save_upload(file: UploadFile, file_path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Copy an uploaded file to disk in a worker thread so the event loop is not blocked"""
+    await asyncio.to_thread(_copy_upload, file.file, file_path, chunk_size)
+    if _is_compressible(file_path):
+        await asyncio.to_thread(_write_gzip_copy, file_path)
+
+
 @router.post("/upload/images", response_model=List[str])
 async def upload_images(
     files: List[UploadFile] = File(...),
@@ -48,6 +265,7 @@ async def upload_images(
 ):
     """Upload image files"""
     uploaded_urls = []
+    saves = []
     
     for file in files:
         # Validate file type
@@ -66,12 +284,11 @@ async def upload_images(
             file_path = MARKETING_PHOTOS_DIR / unique_filename
             relative_path = f"marketing/photos/{unique_filename}"
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        saves.append(_save_upload(file, file_path))
         uploaded_urls.append(relative_path)
     
+    # Save all files concurrently
+    await asyncio.gather(*saves)
     return uploaded_urls
 
 
@@ -83,6 +300,7 @@ async def upload_videos(
 ):
     """Upload video files"""
     uploaded_urls = []
+    saves = []
     
     for file in files:
         # Validate file type
@@ -97,45 +315,97 @@ async def upload_videos(
         file_path = DOCUMENTATION_VIDEOS_DIR / unique_filename
         relative_path = f"documentation/videos/{unique_filename}"
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        saves.append(_save_upload(file, file_path, VIDEO_UPLOAD_CHUNK_SIZE))
         uploaded_urls.append(relative_path)
     
+    # Save all files concurrently
+    await asyncio.gather(*saves)
     return uploaded_urls
 
 
 @router.get("/files/{file_path:path}")
-async def get_media_file(file_path: str):
+async def get_media_file(file_path: str, request: Request):
     """Serve media files - simple and straightforward"""
     # FastAPI automatically URL-decodes path parameters, but handle both cases
     # If path still has encoded chars, decode them
     decoded_path = unquote(file_path) if '%' in file_path else file_path
-    full_path = MEDIA_DIR / decoded_path
+    full_path = os.path.join(_MEDIA_DIR_STR, decoded_path)
     
     # If file doesn't exist, try to find files with matching suffix (handles timestamp prefix)
-    if not full_path.exists() or not full_path.is_file():
-        parent_dir = full_path.parent
-        if parent_dir.exists():
-            requested_filename = full_path.name
-            # Look for files ending with the requested filename
-            matching_files = [f for f in parent_dir.iterdir() 
-                            if f.is_file() and f.name.endswith(requested_filename)]
-            if matching_files:
-                full_path = matching_files[0]
+    if not os.path.isfile(full_path):
+        parent_dir, requested_filename = os.path.split(full_path)
+        if os.path.isdir(parent_dir):
+            # Look for the first file ending with the requested filename (stops at the first match)
+            pattern = os.path.join(glob.escape(parent_dir), f"*{glob.escape(requested_filename)}")
+            match = next(
+                (f for f in glob.iglob(pattern) if os.path.isfile(f)),
+                None
+            ) if requested_filename else None
+            if match is not None:
+                full_path = match
             else:
                 raise HTTPException(status_code=404, detail=f"File not found: {decoded_path}")
         else:
             raise HTTPException(status_code=404, detail=f"Directory not found: {parent_dir}")
     
     # Security check
-    try:
-        full_path.resolve().relative_to(MEDIA_DIR.resolve())
-    except ValueError:
+    if os.path.commonpath([os.path.realpath(full_path), _MEDIA_ROOT_STR]) != _MEDIA_ROOT_STR:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return FileResponse(full_path)
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    
+    # Serve the precompressed copy of text-like files to clients that accept gzip
+    # (with X-Accel-Redirect, nginx's own gzip handling applies instead)
+    compressible = _is_compressible(full_path)
+    content_encoding = None
+    if (compressible and not settings.MEDIA_X_ACCEL_PREFIX
+            and _accepts_gzip(request.headers.get("accept-encoding", ""))
+            and os.path.isfile(f"{full_path}.gz")):
+        full_path = f"{full_path}.gz"
+        content_encoding = "gzip"
+    
+    # Answer conditional requests without sending the body
+    stat_result = os.stat(full_path)
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    cache_headers = {"Cache-Control": MEDIA_CACHE_CONTROL, "ETag": etag, "Accept-Ranges": "bytes"}
+    if compressible:
+        cache_headers["Vary"] = "Accept-Encoding"
+    if content_encoding:
+        cache_headers["Content-Encoding"] = content_encoding
+    if _is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=cache_headers)
+    
+    if settings.MEDIA_X_ACCEL_PREFIX:
+        # Let nginx send the file from its internal location
+        relative_path = os.path.relpath(full_path, _MEDIA_DIR_STR).replace(os.sep, "/")
+        return Response(
+            status_code=200,
+            headers={
+                **cache_headers,
+                "X-Accel-Redirect": f"{settings.MEDIA_X_ACCEL_PREFIX.rstrip('/')}/{relative_path}"
+            },
+            media_type=media_type
+        )
+    
+    # Partial content for video seeking / resumed downloads (ignored if If-Range no longer matches)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and not content_encoding and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, stat_result.st_size)
+        if byte_range:
+            start, end = byte_range
+            return StreamingResponse(
+                _iter_file_range(full_path, start, end),
+                status_code=206,
+                headers={
+                    **cache_headers,
+                    "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+                    "Content-Length": str(end - start + 1),
+                },
+                media_type=media_type
+            )
+    
+    return ZeroCopyFileResponse(full_path, headers=cache_headers, media_type=media_type, stat_result=stat_result)
 
 
 @router.post("/upload/files", response_model=List[str])
@@ -146,6 +416,7 @@ async def upload_files(
 ):
     """Upload generic files (documents, etc.)"""
     uploaded_urls = []
+    saves = []
     
     for file in files:
         # Generate unique filename
@@ -160,12 +431,11 @@ async def upload_files(
             file_path = MARKETING_FILES_DIR / unique_filename
             relative_path = f"marketing/files/{unique_filename}"
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        saves.append(_save_upload(file, file_path))
         uploaded_urls.append(relative_path)
     
+    # Save all files concurrently
+    await asyncio.gather(*saves)
     return uploaded_urls
 
 
@@ -182,46 +452,20 @@ async def upload_any_files(
     - 'documentation': stores in media/documentation/files, images, or videos
     """
     uploaded_attachments = []
+    saves = []
     
     for file in files:
-        # Determine file type
-        content_type = file.content_type or ''
-        
-        if context == "documentation":
-            # Documentation: files, images, videos
-            if content_type.startswith('image/'):
-                file_type = 'image'
-                target_dir = DOCUMENTATION_IMAGES_DIR
-                relative_dir = 'documentation/images'
-            elif content_type.startswith('video/'):
-                file_type = 'video'
-                target_dir = DOCUMENTATION_VIDEOS_DIR
-                relative_dir = 'documentation/videos'
-            else:
-                file_type = 'file'
-                target_dir = DOCUMENTATION_FILES_DIR
-                relative_dir = 'documentation/files'
-        else:
-            # Marketing: files and photos (images)
-            if content_type.startswith('image/'):
-                file_type = 'image'
-                target_dir = MARKETING_PHOTOS_DIR
-                relative_dir = 'marketing/photos'
-            else:
-                file_type = 'file'
-                target_dir = MARKETING_FILES_DIR
-                relative_dir = 'marketing/files'
-        
-        # Sanitize filename: remove parentheses and special characters, append date
-        from datetime import datetime
-        import re
+        # Determine file type from the MIME major type ("image/png" -> "image")
+        storage_context = "documentation" if context == "documentation" else "marketing"
+        kind = (file.content_type or '').partition('/')[0]
+        file_type, target_dir, relative_dir = _UPLOAD_TARGETS.get(
+            (storage_context, kind), _UPLOAD_TARGETS[(storage_context, "file")]
+        )
         
+        # Sanitize filename: replace parentheses, spaces and other special characters
+        # with a single underscore, append date
         original_filename = file.filename or 'file'
-        # Remove parentheses, spaces, and other special characters, replace with underscore
-        sanitized_name = re.sub(r'[()\[\]{}]', '_', original_filename)
-        sanitized_name = re.sub(r'\s+', '_', sanitized_name)  # Replace spaces with underscore
-        sanitized_name = re.sub(r'[^\w\.-]', '_', sanitized_name)  # Remove any remaining special chars
-        sanitized_name = re.sub(r'_+', '_', sanitized_name)  # Replace multiple underscores with single
+        sanitized_name = _FILENAME_UNSAFE_RE.sub('_', original_filename)
         sanitized_name = sanitized_name.strip('_')  # Remove leading/trailing underscores
         
         # Get base name and extension
@@ -229,19 +473,13 @@ async def upload_any_files(
         
         # Append date: YYYYMMDD format
         date_str = datetime.now().strftime('%Y%m%d')
-        filename = f"{base_name}_{date_str}{ext}"
         
-        # Handle conflicts by appending counter
-        file_path = target_dir / filename
-        counter = 1
-        while file_path.exists():
-            filename = f"{base_name}_{date_str}_{counter}{ext}"
-            file_path = target_dir / filename
-            counter += 1
+        # Claim the name atomically (random suffix on conflict)
+        file_path = _reserve_file(target_dir, f"{base_name}_{date_str}", ext)
+        filename = file_path.name
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        chunk_size = VIDEO_UPLOAD_CHUNK_SIZE if file_type == 'video' else UPLOAD_CHUNK_SIZE
+        saves.append(_save_upload(file, file_path, chunk_size))
         
         # Return attachment object
         relative_path = f"{relative_dir}/{filename}"
@@ -251,6 +489,8 @@ async def upload_any_files(
             "name": file.filename or filename
         })
     
+    # Save all files concurrently
+    await asyncio.gather(*saves)
     return uploaded_attachments
 
 
@@ -264,9 +504,11 @@ async def delete_media_file(file_path: str):
     
     # Security check
     try:
-        full_path.resolve().relative_to(MEDIA_DIR.resolve())
+        full_path.resolve().relative_to(_MEDIA_ROOT)
     except ValueError:
         raise HTTPException(status_code=403, detail="Access denied")
     
     full_path.unlink()
+    # Remove the precompressed copy too, if one was written at upload
+    Path(f"{full_path}.gz").unlink(missing_ok=True)
     return {"success": True, "message": "File deleted"}
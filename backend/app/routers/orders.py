@@ -1,16 +1,225 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Body
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, or_, func
+from sqlalchemy.dialects.postgresql import array
 from sqlalchemy.orm import Session
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import attrgetter
+from typing import List, Dict, Optional, Tuple, Iterable
+import logging
+import threading
+import time
 from app.database import get_db
 from app import models, schemas
 from app.services.order_service import OrderService
 from app.auth import get_current_active_user, get_business_id
+from app.routers.webhooks import _map_yandex_status
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
+# Maximum number of orders whose status is refreshed from Yandex per orders-list request
+MAX_STATUS_REFRESHES = 10
 
-@router.get("/", response_model=List[schemas.Order])
+# Age windows (seconds) for order statuses refreshed from Yandex by the orders list:
+# younger than FRESH - served as is; younger than STALE - served as is and refreshed in
+# the background; older (or never refreshed by this process) - refreshed before responding
+STATUS_FRESH_SECONDS = 30
+STATUS_STALE_SECONDS = 300
+
+# (business_id, yandex_order_id) -> monotonic time of the last status refresh
+_status_refreshed_at: Dict[Tuple[int, str], float] = {}
+_status_refreshed_lock = threading.Lock()
+
+
+def _status_age(business_id: int, yandex_id: str) -> Optional[float]:
+    """Seconds since the order's status was last refreshed, or None if never"""
+    with _status_refreshed_lock:
+        refreshed_at = _status_refreshed_at.get((business_id, yandex_id))
+    return None if refreshed_at is None else time.monotonic() - refreshed_at
+
+
+def _mark_status_refreshed(business_id: int, yandex_ids: Iterable[str]):
+    """Record that these orders' statuses were just refreshed"""
+    now = time.monotonic()
+    with _status_refreshed_lock:
+        for yandex_id in yandex_ids:
+            _status_refreshed_at[(business_id, yandex_id)] = now
+        # Drop entries past the stale window so the map stays small
+        if len(_status_refreshed_at) > 10000:
+            for key, refreshed_at in list(_status_refreshed_at.items()):
+                if now - refreshed_at > STATUS_STALE_SECONDS:
+                    del _status_refreshed_at[key]
+
+
+def _orders_with_products_query(db: Session, business_id: int):
+    """Query (Order, Product) rows for a business; Product is None if it's missing or belongs to another business"""
+    return db.query(models.Order, models.Product).outerjoin(
+        models.Product,
+        and_(
+            models.Product.id == models.Order.product_id,
+            models.Product.business_id == business_id
+        )
+    ).filter(models.Order.business_id == business_id)
+
+
+def _parse_filter_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO date query parameter (accepts a trailing Z); None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def _order_list_filters(status: Optional[str], start_date: Optional[str], end_date: Optional[str]):
+    """Parse the orders-list filter parameters once (invalid values are ignored)
+    
+    Returns the SQL criteria and a predicate that re-checks the status filter on a loaded order.
+    """
+    criteria = []
+    status_matches = lambda order: True
+    if status:
+        # Special handling for "unfinished" filter - show all orders that are not finished
+        if status.lower() == "unfinished":
+            criteria.append(models.Order.status != models.OrderStatus.FINISHED)
+            status_matches = lambda order: order.status != models.OrderStatus.FINISHED
+        else:
+            # Convert string status to enum for comparison
+            status_enum = models.OrderStatus.__members__.get(status.upper())
+            if status_enum is not None:
+                criteria.append(models.Order.status == status_enum)
+                status_matches = lambda order: order.status == status_enum
+    
+    start_dt = _parse_filter_date(start_date)
+    if start_dt:
+        criteria.append(models.Order.created_at >= start_dt)
+    end_dt = _parse_filter_date(end_date)
+    if end_dt:
+        criteria.append(models.Order.created_at <= end_dt)
+    return criteria, status_matches
+
+
+def _fetch_order_page(query, skip: int, limit: int):
+    """Load the (Order, Product) rows of one page of Yandex orders
+    
+    Pagination is by yandex_order_id (one logical order = all its item records), newest first,
+    so exactly `limit` orders are loaded instead of over-fetching rows and grouping in Python.
+    `query` is an _orders_with_products_query with the list filters applied.
+    """
+    page = query.with_entities(
+        models.Order.yandex_order_id,
+        func.max(models.Order.created_at).label("latest_created_at")
+    ).group_by(models.Order.yandex_order_id).order_by(
+        func.max(models.Order.created_at).desc().nullslast(),
+        models.Order.yandex_order_id
+    ).offset(skip).limit(limit).subquery()
+    return query.join(
+        page, page.c.yandex_order_id == models.Order.yandex_order_id
+    ).order_by(
+        page.c.latest_created_at.desc().nullslast(),
+        models.Order.yandex_order_id,
+        models.Order.created_at.desc()
+    ).all()
+
+
+def _fetch_yandex_orders(yandex_api, yandex_ids: List[str]) -> Dict[str, dict]:
+    """Fetch several orders from Yandex concurrently; orders that fail to load are left out"""
+    def fetch(yandex_id):
+        try:
+            logger.debug("Refreshing order status from Yandex for order %s", yandex_id)
+            return yandex_id, yandex_api.get_order(str(yandex_id))
+        except Exception as e:
+            logger.warning("Could not refresh order %s status: %s", yandex_id, e)
+            return yandex_id, None
+    
+    if not yandex_ids:
+        return {}
+    # The HTTP calls overlap, so the refresh takes about one round trip instead of one per order
+    with ThreadPoolExecutor(max_workers=len(yandex_ids)) as pool:
+        return {yandex_id: data for yandex_id, data in pool.map(fetch, yandex_ids) if data is not None}
+
+
+def _apply_fresh_orders(db: Session, business_id: int, fresh_orders: Dict[str, dict], now: Optional[datetime] = None):
+    """Store fresh Yandex order data and the mapped status on the matching order records"""
+    # Only orders whose fresh data carries a status are updated
+    fresh_orders = {yandex_id: data for yandex_id, data in fresh_orders.items() if data.get("status")}
+    if not fresh_orders:
+        return
+    
+    now = now or datetime.now(timezone.utc)
+    try:
+        # Load the records of all refreshed orders at once (filter by business_id)
+        order_records = db.query(models.Order).filter(
+            models.Order.yandex_order_id.in_(list(fresh_orders)),
+            models.Order.business_id == business_id
+        ).all()
+        
+        for order_record in order_records:
+            fresh_order_data = fresh_orders[order_record.yandex_order_id]
+            fresh_status = fresh_order_data["status"]
+            # Update yandex_order_data with fresh data
+            order_record.yandex_order_data = fresh_order_data
+            order_record.yandex_status = fresh_status
+            
+            # Only update status if it's not already FINISHED (manual override takes precedence)
+            if order_record.status != models.OrderStatus.FINISHED:
+                # Map Yandex status to our status
+                mapped_status = _map_yandex_status(fresh_status)
+                order_record.status = mapped_status
+                
+                # Auto-complete if DELIVERED and activation codes are sent
+                # But only if status is not FINISHED (already checked above)
+                if fresh_status == "DELIVERED" and order_record.activation_code_sent:
+                    order_record.status = models.OrderStatus.COMPLETED
+                    if not order_record.completed_at:
+                        order_record.completed_at = now
+        
+        # One transaction for all refreshed orders
+        db.commit()
+        for yandex_id, fresh_order_data in fresh_orders.items():
+            logger.info("Updated order %s status to %s", yandex_id, fresh_order_data["status"])
+    except Exception as e:
+        logger.warning("Could not store refreshed order statuses: %s", e)
+        # Continue with cached data if refresh fails
+        db.rollback()
+
+
+def _refresh_orders_in_background(business_id: int, yandex_ids: List[str]):
+    """Refresh order statuses from Yandex after the response was sent (uses its own DB session)"""
+    from app.database import SessionLocal
+    from app.services.yandex_api import YandexMarketAPI
+    
+    db = SessionLocal()
+    try:
+        yandex_api = YandexMarketAPI(business_id=business_id, db=db)
+        _apply_fresh_orders(db, business_id, _fetch_yandex_orders(yandex_api, yandex_ids))
+    except Exception as e:
+        logger.warning("Background order status refresh failed: %s", e)
+    finally:
+        db.close()
+
+
+def _extract_yandex_items(yandex_order_data) -> list:
+    """Extract the items list from yandex_order_data
+    
+    Yandex response structure: { "items": [...] } or { "order": { "items": [...] } }
+    The JSONB column is already decoded to a dict by the driver when the row is loaded.
+    """
+    if not isinstance(yandex_order_data, dict):
+        return []
+    yandex_items = yandex_order_data.get("items", [])
+    if not yandex_items and "order" in yandex_order_data:
+        yandex_items = yandex_order_data["order"].get("items", [])
+    return yandex_items
+
+
+@router.get("/", response_model=List[schemas.Order], response_class=ORJSONResponse)
 def get_orders(
+    background_tasks: BackgroundTasks,
     skip: int = 0,
     limit: int = 100,
     status: str = None,
@@ -27,50 +236,26 @@ def get_orders(
     If refresh_status is True, will fetch fresh order status from Yandex API for orders
     that are in PROCESSING status to check if they've been DELIVERED.
     """
-    from datetime import datetime
     from app.services.yandex_api import YandexMarketAPI
     from app.config import settings
     
     business_id = get_business_id(current_user)
-    query = db.query(models.Order).filter(models.Order.business_id == business_id)
-    
-    if status:
-        # Special handling for "unfinished" filter - show all orders that are not finished
-        if status.lower() == "unfinished":
-            query = query.filter(models.Order.status != models.OrderStatus.FINISHED)
-        else:
-            # Convert string status to enum for comparison
-            status_upper = status.upper()
-            try:
-                status_enum = models.OrderStatus[status_upper]
-                query = query.filter(models.Order.status == status_enum)
-            except KeyError:
-                # Invalid status, ignore filter
-                pass
-    
-    if start_date:
-        try:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            query = query.filter(models.Order.created_at >= start_dt)
-        except:
-            pass
-    
-    if end_date:
-        try:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            query = query.filter(models.Order.created_at <= end_dt)
-        except:
-            pass
+    # One timestamp for every completion recorded by this request
+    now_utc = datetime.now(timezone.utc)
+    # Each order row comes with its product in the same query
+    criteria, status_matches = _order_list_filters(status, start_date, end_date)
+    query = _orders_with_products_query(db, business_id).filter(*criteria)
     
-    orders = query.order_by(models.Order.created_at.desc()).offset(skip).limit(limit * 10).all()  # Get more to account for grouping
+    rows = _fetch_order_page(query, skip, limit)
+    orders = [order for order, _ in rows]
     
     # Refresh order status from Yandex for orders that might be stale
     if refresh_status:
         try:
             from app.services.config_validator import ConfigurationError, format_config_error_response
-            yandex_api = YandexMarketAPI(business_id=business_id, db=db)
             unique_yandex_order_ids = set()
-            orders_to_refresh = []
+            orders_to_refresh = []  # refreshed before responding
+            orders_to_revalidate = []  # refreshed in the background
             
             # Collect unique order IDs that need refreshing
             for order in orders:
@@ -83,109 +268,90 @@ def get_orders(
                     if (order.status != models.OrderStatus.FINISHED and 
                         (order.status == models.OrderStatus.PROCESSING or 
                          order.yandex_status in ["PROCESSING", None, ""])):
-                        orders_to_refresh.append(yandex_id)
-            
-            # Refresh orders in batch (limit to avoid too many API calls)
-            for yandex_id in orders_to_refresh[:10]:  # Limit to 10 refreshes per request
-                try:
-                    print(f"🔄 Refreshing order status from Yandex for order {yandex_id}")
-                    fresh_order_data = yandex_api.get_order(str(yandex_id))
-                    
-                    # Extract status from fresh data
-                    fresh_status = fresh_order_data.get("status")
-                    if fresh_status:
-                        # Update all order records with this yandex_order_id (filter by business_id)
-                        all_orders_for_id = db.query(models.Order).filter(
-                            models.Order.yandex_order_id == yandex_id,
-                            models.Order.business_id == business_id
-                        ).all()
-                        
-                        for order_record in all_orders_for_id:
-                            # Update yandex_order_data with fresh data
-                            order_record.yandex_order_data = fresh_order_data
-                            order_record.yandex_status = fresh_status
-                            
-                            # Only update status if it's not already FINISHED (manual override takes precedence)
-                            if order_record.status != models.OrderStatus.FINISHED:
-                                # Map Yandex status to our status
-                                from app.routers.webhooks import _map_yandex_status
-                                mapped_status = _map_yandex_status(fresh_status)
-                                order_record.status = mapped_status
-                                
-                                # Auto-complete if DELIVERED and activation codes are sent
-                                # But only if status is not FINISHED (already checked above)
-                                if fresh_status == "DELIVERED" and order_record.activation_code_sent:
-                                    order_record.status = models.OrderStatus.COMPLETED
-                                    if not order_record.completed_at:
-                                        order_record.completed_at = datetime.utcnow()
-                        
-                        db.commit()
-                        print(f"✅ Updated order {yandex_id} status to {fresh_status}")
-                except Exception as e:
-                    print(f"⚠️  Could not refresh order {yandex_id} status: {str(e)}")
-                    # Continue with cached data if refresh fails
-                    db.rollback()
-                    pass
+                        # Skip orders refreshed moments ago; revalidate recently refreshed ones later
+                        age = _status_age(business_id, yandex_id)
+                        if age is None or age >= STATUS_STALE_SECONDS:
+                            orders_to_refresh.append(yandex_id)
+                        elif age >= STATUS_FRESH_SECONDS:
+                            orders_to_revalidate.append(yandex_id)
             
-            # Re-query orders after refresh to get updated status
-            # IMPORTANT: Re-query to get fresh data from database, especially for FINISHED status
+            # Fetch orders from Yandex concurrently (limit to avoid too many API calls),
+            # then apply the results using this request's DB session. The API client (which
+            # loads the business's credentials) is only created when something needs fetching
+            fresh_orders = {}
             if orders_to_refresh:
-                # Rebuild query to get fresh data (filter by business_id)
-                fresh_query = db.query(models.Order).filter(models.Order.business_id == business_id)
-                if status:
-                    if status.lower() == "unfinished":
-                        fresh_query = fresh_query.filter(models.Order.status != models.OrderStatus.FINISHED)
-                    else:
-                        status_upper = status.upper()
-                        try:
-                            status_enum = models.OrderStatus[status_upper]
-                            fresh_query = fresh_query.filter(models.Order.status == status_enum)
-                        except KeyError:
-                            pass
-                if start_date:
-                    try:
-                        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                        fresh_query = fresh_query.filter(models.Order.created_at >= start_dt)
-                    except:
-                        pass
-                if end_date:
-                    try:
-                        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                        fresh_query = fresh_query.filter(models.Order.created_at <= end_dt)
-                    except:
-                        pass
-                orders = fresh_query.order_by(models.Order.created_at.desc()).offset(skip).limit(limit * 10).all()
+                yandex_api = YandexMarketAPI(business_id=business_id, db=db)
+                fresh_orders = _fetch_yandex_orders(yandex_api, orders_to_refresh[:MAX_STATUS_REFRESHES])
+                _mark_status_refreshed(business_id, fresh_orders)
+                _apply_fresh_orders(db, business_id, fresh_orders, now_utc)
+            
+            # Stale statuses are served as they are and revalidated after the response is sent
+            if orders_to_revalidate:
+                revalidate_ids = orders_to_revalidate[:MAX_STATUS_REFRESHES]
+                # Mark now so concurrent requests don't schedule the same refresh
+                _mark_status_refreshed(business_id, revalidate_ids)
+                background_tasks.add_task(_refresh_orders_in_background, business_id, revalidate_ids)
+            
+            # The refreshed rows are the same session objects as `orders`, so they already hold
+            # the new data; only the status filter can stop matching (dates don't change)
+            if fresh_orders and status:
+                orders = [o for o in orders if status_matches(o)]
         except ConfigurationError as e:
             # Configuration error - log but don't fail the request
-            print(f"⚠️  Yandex API configuration required: {e.message}")
+            logger.warning("Yandex API configuration required: %s", e.message)
         except Exception as e:
-            print(f"⚠️  Could not initialize Yandex API: {str(e)}")
+            logger.warning("Could not initialize Yandex API: %s", e)
+    
+    # Group orders by yandex_order_id: the page query returns each order's records next to
+    # each other (newest order first), so consecutive runs are the groups, already in order
+    order_groups = [list(group) for _, group in groupby(orders, key=attrgetter("yandex_order_id"))]
     
-    # Group orders by yandex_order_id
-    orders_by_yandex_id = {}
+    # Products of the order records were loaded with the orders; Yandex items without an
+    # order record are looked up by offer/SKU in one batched query (filtered by business_id)
+    products_by_id = {product.id: product for _, product in rows if product is not None}
+    
+    offer_ids = set()
     for order in orders:
-        yandex_id = order.yandex_order_id
-        if yandex_id not in orders_by_yandex_id:
-            orders_by_yandex_id[yandex_id] = []
-        orders_by_yandex_id[yandex_id].append(order)
+        for yandex_item in _extract_yandex_items(order.yandex_order_data):
+            offer_ids.update(filter(None, (yandex_item.get("offerId"), yandex_item.get("shopSku"))))
+    products_by_offer = {}
+    if offer_ids:
+        for p in db.query(models.Product).filter(
+            models.Product.business_id == business_id,
+            or_(
+                models.Product.yandex_market_id.in_(offer_ids),
+                models.Product.yandex_market_sku.in_(offer_ids)
+            )
+        ).all():
+            for key in (p.yandex_market_id, p.yandex_market_sku):
+                if key:
+                    products_by_offer.setdefault(key, p)
+    
+    # Yandex order IDs on this page that already have a client: one JSONB "?|" query
+    # (served by the GIN index on clients.order_ids) instead of scanning all clients per order
+    page_yandex_ids = [group[0].yandex_order_id for group in order_groups if group[0].yandex_order_id]
+    client_order_ids = set()
+    if page_yandex_ids:
+        for (order_ids,) in db.query(models.Client.order_ids).filter(
+            models.Client.business_id == business_id,
+            models.Client.order_ids.has_any(array(page_yandex_ids))
+        ).all():
+            if isinstance(order_ids, list):
+                client_order_ids.update(order_ids)
     
     # Build result: one entry per yandex_order_id with all items
     result = []
-    seen_yandex_ids = set()
+    # Status and sent-flag updates are flushed per group but committed once after the loop:
+    # a commit expires every order and product loaded for this page
+    has_updates = False
     
-    for order in orders:
-        yandex_id = order.yandex_order_id
-        if yandex_id in seen_yandex_ids:
-            continue
-        seen_yandex_ids.add(yandex_id)
-        
-        # Get all orders with this yandex_order_id
-        order_group = orders_by_yandex_id[yandex_id]
+    for order_group in order_groups:
+        yandex_id = order_group[0].yandex_order_id
         
         # Use the first order as the base (they share customer info, dates, etc.)
-        # IMPORTANT: Refresh from database to ensure we have the latest status (especially FINISHED)
+        # Rows were loaded (or re-loaded after the status refresh) by this request and are
+        # updated in place below, so attribute access already reads the latest status
         base_order = order_group[0]
-        db.refresh(base_order)  # Ensure we have the latest status from database
         
         # Get all products in this order
         order_items = []
@@ -194,51 +360,41 @@ def get_orders(
         
         # Get yandex_order_data to extract item IDs
         yandex_order_data = base_order.yandex_order_data or {}
-        if isinstance(yandex_order_data, str):
-            import json
-            try:
-                yandex_order_data = json.loads(yandex_order_data)
-            except:
-                yandex_order_data = {}
-        
-        # Extract items from yandex_order_data
-        # Yandex response structure: { "items": [...] } or { "order": { "items": [...] } }
-        yandex_items = yandex_order_data.get("items", [])
-        if not yandex_items and isinstance(yandex_order_data, dict) and "order" in yandex_order_data:
-            yandex_items = yandex_order_data["order"].get("items", [])
+        yandex_items = _extract_yandex_items(yandex_order_data)
         
         # Debug: Log items extraction
         if not yandex_items:
-            print(f"⚠️  Warning: Order {base_order.yandex_order_id} has no items in yandex_order_data")
-            print(f"   yandex_order_data keys: {list(yandex_order_data.keys()) if isinstance(yandex_order_data, dict) else 'not a dict'}")
+            logger.debug(
+                "Order %s has no items in yandex_order_data (keys: %s)",
+                yandex_id, list(yandex_order_data) if isinstance(yandex_order_data, dict) else "not a dict"
+            )
         else:
-            print(f"✅ Order {base_order.yandex_order_id} has {len(yandex_items)} items in yandex_order_data")
+            logger.debug("Order %s has %s items in yandex_order_data", yandex_id, len(yandex_items))
         
         # CRITICAL FIX: Build items array from Yandex items (source of truth), not just database records
         # This ensures ALL products from Yandex are shown, even if some aren't in our database
         processed_yandex_item_ids = set()
         
+        # Index the Yandex items by offer ID (shopSku if there's none) once per order,
+        # so each order record finds its item with a dict lookup
+        offer_to_item = {}
+        for yandex_item in yandex_items:
+            item_offer_id = yandex_item.get("offerId") or yandex_item.get("shopSku")
+            if item_offer_id:
+                offer_to_item.setdefault(item_offer_id, yandex_item)
+        
         # First, process items that have matching order records in database
         for o in order_group:
-            # Filter product by business_id to ensure data isolation
-            product = db.query(models.Product).filter(
-                models.Product.id == o.product_id,
-                models.Product.business_id == business_id
-            ).first()
+            product = products_by_id.get(o.product_id)
             if product:
                 # Find matching Yandex item to get item ID
                 yandex_item_id = None
                 yandex_offer_id = None
-                matching_yandex_item = None
-                
-                for yandex_item in yandex_items:
-                    item_offer_id = yandex_item.get("offerId") or yandex_item.get("shopSku")
-                    if item_offer_id == product.yandex_market_id or item_offer_id == product.yandex_market_sku:
-                        yandex_item_id = yandex_item.get("id")
-                        yandex_offer_id = item_offer_id
-                        matching_yandex_item = yandex_item
-                        processed_yandex_item_ids.add(yandex_item_id)
-                        break
+                matching_yandex_item = offer_to_item.get(product.yandex_market_id) or offer_to_item.get(product.yandex_market_sku)
+                if matching_yandex_item:
+                    yandex_item_id = matching_yandex_item.get("id")
+                    yandex_offer_id = matching_yandex_item.get("offerId") or matching_yandex_item.get("shopSku")
+                    processed_yandex_item_ids.add(yandex_item_id)
                 
                 # Use price from Yandex item if available, otherwise from order record
                 if matching_yandex_item:
@@ -279,15 +435,8 @@ def get_orders(
             item_total = item_price * item_count
             item_name = yandex_item.get("offerName") or offer_id or "Unknown Product"
             
-            # Try to find product in database (filter by business_id)
-            product = db.query(models.Product).filter(
-                models.Product.business_id == business_id
-            ).filter(
-                (models.Product.yandex_market_id == offer_id) |
-                (models.Product.yandex_market_id == yandex_item.get("shopSku")) |
-                (models.Product.yandex_market_sku == offer_id) |
-                (models.Product.yandex_market_sku == yandex_item.get("shopSku"))
-            ).first()
+            # Try to find product in database (preloaded above, filtered by business_id)
+            product = products_by_offer.get(offer_id) or products_by_offer.get(yandex_item.get("shopSku"))
             
             if product:
                 # Product exists but no order record - this shouldn't happen, but handle it
@@ -322,12 +471,10 @@ def get_orders(
             
             total_amount += item_total
             processed_yandex_item_ids.add(yandex_item_id)
-            print(f"  ℹ️  Added Yandex item {yandex_item_id} ({item_name}) - product {'found' if product else 'NOT in database'}")
-        
-        # Convert order_items to OrderItem schema objects
-        order_item_objects = [
-            schemas.OrderItem(**item) for item in order_items
-        ]
+            logger.debug(
+                "Added Yandex item %s (%s) - product %s",
+                yandex_item_id, item_name, "found" if product else "NOT in database"
+            )
         
         # Extract delivery type from yandex_order_data
         delivery_type = None
@@ -346,48 +493,49 @@ def get_orders(
                 for o in order_group:
                     o.status = models.OrderStatus.COMPLETED
                     if not o.completed_at:
-                        from datetime import datetime
-                        o.completed_at = datetime.utcnow()
-                db.commit()
-                # Refresh base_order to get updated status from database
-                db.refresh(base_order)
-                print(f"✅ Auto-completed order {base_order.yandex_order_id} (Yandex status: DELIVERED, activation codes already sent)")
+                        o.completed_at = now_utc
+                logger.info("Auto-completed order %s (Yandex status: DELIVERED, activation codes already sent)", yandex_id)
         
         # Ensure digital products with COMPLETED or FINISHED status are marked as sent
         # Import here to avoid circular imports
         from app.main import _ensure_digital_products_marked_as_sent
         try:
             _ensure_digital_products_marked_as_sent(order_group, db)
-            db.commit()
+            if db.dirty:
+                db.flush()
+                has_updates = True
         except Exception as e:
-            print(f"⚠️  Error ensuring digital products marked as sent: {str(e)}")
+            logger.warning("Error ensuring digital products marked as sent: %s", e)
             db.rollback()
+            has_updates = False
         
-        # Check if a client already exists for this order
-        # Query clients and check if order_id is in their order_ids array
-        has_client = False
-        # Use a simple Python check - it's fast enough for most use cases
-        # Query all clients for this business and check their order_ids (including empty arrays)
-        business_id = get_business_id(current_user)
-        all_clients = db.query(models.Client).filter(models.Client.business_id == business_id).all()
-        for client in all_clients:
-            # Check if order_ids exists and contains the yandex_id
-            if client.order_ids is not None:
-                # Handle both list and JSONB array formats
-                order_ids_list = client.order_ids if isinstance(client.order_ids, list) else []
-                if yandex_id in order_ids_list:
-                    has_client = True
-                    break
+        # Check if a client already exists for this order (preloaded above)
+        has_client = yandex_id in client_order_ids
         
         # Build order dict with items
         # IMPORTANT: Always use the actual status from database - FINISHED status takes precedence over Yandex API
-        # Refresh base_order one more time to ensure we have the absolute latest status from database
-        db.refresh(base_order)
+        # Stored columns are listed explicitly: the instance __dict__ also carries SQLAlchemy state
+        # and misses any attribute expired by the flush above (e.g. the server-set updated_at)
         order_dict = {
-            **base_order.__dict__,
+            "id": base_order.id,
+            "yandex_order_id": base_order.yandex_order_id,
+            "product_id": base_order.product_id,
+            "customer_name": base_order.customer_name,
+            "customer_email": base_order.customer_email,
+            "customer_phone": base_order.customer_phone,
+            "buyer_id": base_order.buyer_id,
+            "quantity": base_order.quantity,
+            "yandex_status": base_order.yandex_status,
+            "yandex_order_data": base_order.yandex_order_data,
+            "activation_code_sent_at": base_order.activation_code_sent_at,
+            "activation_key_id": base_order.activation_key_id,
+            "created_at": base_order.created_at,
+            "updated_at": base_order.updated_at,
+            "completed_at": base_order.completed_at,
+            "order_created_at": base_order.order_created_at,
             "product_name": order_items[0]["product_name"] if order_items else None,  # First product for display
             "total_amount": total_amount,  # Sum of all items
-            "items": order_item_objects,  # All products in this order (as OrderItem objects)
+            "items": order_items,  # All products in this order (validated as OrderItem below)
             "items_count": len(order_items),  # Number of products
             "activation_code_sent": all_activation_sent,  # True only if ALL items have activation sent
             "delivery_type": delivery_type,  # "DIGITAL" or "DELIVERY"
@@ -395,15 +543,21 @@ def get_orders(
             "has_client": has_client,  # Whether a client already exists for this order
         }
         
-        # Convert to Order schema to ensure proper serialization
-        order_schema = schemas.Order(**order_dict)
+        # Validate once into the Order schema (items included); the response serializes these
+        # directly, so this is the only validation pass
+        order_schema = schemas.Order.model_validate(order_dict)
         result.append(order_schema)
         
         # Limit results
         if len(result) >= limit:
             break
     
-    return result
+    if has_updates:
+        db.commit()
+    
+    # Entries are already validated Order schemas - serialize them directly instead of
+    # letting FastAPI validate them against response_model a second time
+    return ORJSONResponse([o.model_dump(mode="json") for o in result])
 
 
 @router.get("/{order_id}", response_model=schemas.Order)
@@ -414,11 +568,8 @@ def get_order(
 ):
     """Get a single order by ID"""
     business_id = get_business_id(current_user)
-    order = db.query(models.Order).filter(
-        models.Order.id == order_id,
-        models.Order.business_id == business_id
-    ).first()
-    if not order:
+    order = db.get(models.Order, order_id)
+    if not order or order.business_id != business_id:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
@@ -440,19 +591,17 @@ def create_order(
     if existing:
         raise HTTPException(status_code=400, detail="Order already exists")
     
-    order_data = order.dict()
+    # Only pass fields the caller set so column defaults apply to the rest
+    order_data = order.model_dump(exclude_unset=True, exclude_none=True)
     order_data['business_id'] = business_id
     db_order = models.Order(**order_data)
     db.add(db_order)
     db.commit()
     db.refresh(db_order)
     
-    # Auto-process digital products
-    product = db.query(models.Product).filter(
-        models.Product.id == db_order.product_id,
-        models.Product.business_id == business_id
-    ).first()
-    if product and product.product_type == models.ProductType.DIGITAL:
+    # Auto-process digital products (identity-map lookup, then business check)
+    product = db.get(models.Product, db_order.product_id)
+    if product and product.business_id == business_id and product.product_type == models.ProductType.DIGITAL:
         order_service = OrderService(db, business_id=business_id)
         order_service.auto_fulfill_order(db_order)
     
@@ -468,14 +617,11 @@ def update_order(
 ):
     """Update an order"""
     business_id = get_business_id(current_user)
-    db_order = db.query(models.Order).filter(
-        models.Order.id == order_id,
-        models.Order.business_id == business_id
-    ).first()
-    if not db_order:
+    db_order = db.get(models.Order, order_id)
+    if not db_order or db_order.business_id != business_id:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    update_data = order_update.dict(exclude_unset=True)
+    update_data = order_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_order, field, value)
     
@@ -492,18 +638,22 @@ def fulfill_order(
 ):
     """Manually fulfill an order (assign activation key and send email)"""
     business_id = get_business_id(current_user)
-    order = db.query(models.Order).filter(
+    # Load the order and its product in one query; the product is filtered by business_id
+    # to ensure data isolation (outer join so a missing product still yields the order)
+    row = db.query(models.Order, models.Product).outerjoin(
+        models.Product,
+        and_(
+            models.Product.id == models.Order.product_id,
+            models.Product.business_id == business_id
+        )
+    ).filter(
         models.Order.id == order_id,
         models.Order.business_id == business_id
     ).first()
-    if not order:
+    if not row:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # Filter product by business_id to ensure data isolation
-    product = db.query(models.Product).filter(
-        models.Product.id == order.product_id,
-        models.Product.business_id == business_id
-    ).first()
+    order, product = row
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -531,11 +681,8 @@ def complete_order(
     """
     business_id = get_business_id(current_user)
     # Get the order
-    order = db.query(models.Order).filter(
-        models.Order.id == order_id,
-        models.Order.business_id == business_id
-    ).first()
-    if not order:
+    order = db.get(models.Order, order_id)
+    if not order or order.business_id != business_id:
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Extract activation_keys from body if provided
@@ -571,11 +718,8 @@ def mark_order_finished(
     The UI will show "finished" even if Yandex API says DELIVERED.
     """
     business_id = get_business_id(current_user)
-    order = db.query(models.Order).filter(
-        models.Order.id == order_id,
-        models.Order.business_id == business_id
-    ).first()
-    if not order:
+    order = db.get(models.Order, order_id)
+    if not order or order.business_id != business_id:
         raise HTTPException(status_code=404, detail="Order not found")
     
     if order.status != models.OrderStatus.COMPLETED:
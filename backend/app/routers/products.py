@@ -1,14 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, load_only, raiseload
 from sqlalchemy import or_ as sql_or
-from typing import List
+from typing import List, Dict, Optional, Tuple
 import json
+import logging
+import orjson
+import threading
+import time
 from app.database import get_db
 from app import models, schemas
 from app.services.yandex_api import YandexMarketAPI
 from app.auth import get_current_active_user, get_business_id
+from app.config import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Seconds a business's Yandex catalog index is reused for single-product lookups
+YANDEX_CATALOG_TTL_SECONDS = 30
+
+# business_id -> (monotonic fetch time, Yandex products by id, Yandex products by sku)
+_yandex_catalog_cache: Dict[int, Tuple[float, Dict[str, dict], Dict[str, dict]]] = {}
+_yandex_catalog_lock = threading.Lock()
+
+
+def _find_yandex_product(yandex_api: YandexMarketAPI, business_id: int, yandex_market_id: Optional[str], yandex_market_sku: Optional[str]) -> Optional[dict]:
+    """Find a product in the business's Yandex catalog by id or SKU
+    
+    The catalog is downloaded at most once per YANDEX_CATALOG_TTL_SECONDS and indexed,
+    instead of being fetched and scanned on every product view/update.
+    """
+    with _yandex_catalog_lock:
+        cached = _yandex_catalog_cache.get(business_id)
+    if cached is None or time.monotonic() - cached[0] >= YANDEX_CATALOG_TTL_SECONDS:
+        by_id, by_sku = {}, {}
+        for yandex_product in yandex_api.get_products():
+            if yandex_product.get("id"):
+                by_id.setdefault(yandex_product["id"], yandex_product)
+            if yandex_product.get("sku"):
+                by_sku.setdefault(yandex_product["sku"], yandex_product)
+        cached = (time.monotonic(), by_id, by_sku)
+        with _yandex_catalog_lock:
+            _yandex_catalog_cache[business_id] = cached
+    _, by_id, by_sku = cached
+    return by_id.get(yandex_market_id) or by_sku.get(yandex_market_sku)
+
+
+def _invalidate_yandex_catalog(business_id: int):
+    """Drop the cached catalog index after pushing changes to Yandex"""
+    with _yandex_catalog_lock:
+        _yandex_catalog_cache.pop(business_id, None)
+
+
+# product_id -> (state, error) of the last Yandex push started by update_product,
+# state being "pending", "synced" or "failed"
+_yandex_sync_state: Dict[int, Tuple[str, Optional[str]]] = {}
+_yandex_sync_lock = threading.Lock()
+
+
+def _set_yandex_sync_state(product_id: int, state: str, error: Optional[str] = None):
+    with _yandex_sync_lock:
+        _yandex_sync_state[product_id] = (state, error)
+
+
+def _reconcile_yandex(product_id: int, yandex_field_updates: dict):
+    """Push a product edit to Yandex and store the confirmed values (runs after the response, uses its own DB session)"""
+    from app.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        db_product = db.get(models.Product, product_id)
+        if not db_product:
+            _set_yandex_sync_state(product_id, "failed", "Product not found")
+            return
+        business_id = db_product.business_id
+        yandex_api = YandexMarketAPI(business_id=business_id, db=db)
+        
+        # Step 1: Push updates to Yandex using yandex_field_updates
+        yandex_api.update_product(db_product, field_updates=yandex_field_updates)
+        # The cached catalog no longer reflects this product
+        _invalidate_yandex_catalog(business_id)
+        
+        # Step 2: Sync back from Yandex to get confirmed values (local-only fields are left as they are)
+        yandex_product = _find_yandex_product(yandex_api, business_id, db_product.yandex_market_id, db_product.yandex_market_sku)
+        if yandex_product:
+            # Update yandex_full_data with latest from Yandex (merge our updates)
+            db_product.yandex_full_data = {**yandex_product, **yandex_field_updates}
+            
+            # Update basic fields from Yandex
+            db_product.name = yandex_product.get("name", db_product.name)
+            db_product.description = yandex_product.get("description", db_product.description)
+            db_product.selling_price = yandex_product.get("price", db_product.selling_price)
+            db_product.is_synced = True
+        db.commit()
+        _set_yandex_sync_state(product_id, "synced")
+        logger.info("Pushed product %s updates to Yandex", product_id)
+    except Exception as e:
+        # The local changes are already saved - mark the product as not synced
+        logger.exception("Product %s updated locally but failed to sync to Yandex: %s", product_id, e)
+        db.rollback()
+        try:
+            db.query(models.Product).filter(models.Product.id == product_id).update({"is_synced": False})
+            db.commit()
+        except Exception:
+            db.rollback()
+        _set_yandex_sync_state(product_id, "failed", str(e))
+    finally:
+        db.close()
+
+
+# Columns read by _convert_product_json_fields; list queries load only these (the products
+# table has ~30 more Yandex attribute columns and the generated_keys JSON)
+PRODUCT_RESPONSE_COLUMNS = (
+    models.Product.id, models.Product.name, models.Product.description, models.Product.product_type,
+    models.Product.cost_price, models.Product.selling_price, models.Product.supplier_url,
+    models.Product.supplier_name, models.Product.yandex_market_id, models.Product.yandex_market_sku,
+    models.Product.email_template_id, models.Product.documentation_id, models.Product.is_active,
+    models.Product.is_synced, models.Product.created_at, models.Product.updated_at,
+    models.Product.yandex_full_data,
+)
+
+
+def _decode_generated_keys(value) -> Optional[list]:
+    """Read products.generated_keys as a list
+    
+    Rows not yet converted by the convert_products_generated_keys_to_arrays migration still
+    hold a JSON string. Returns None when the value can't be decoded into a list, in which
+    case callers must not write the column back.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+    return value if isinstance(value, list) else None
+
+
+def _product_list_options() -> tuple:
+    """Loader options for product list queries: only the response columns, in one query
+    
+    With RAISE_ON_LAZY_LOAD, touching any other column or relationship raises instead of
+    issuing a query per product.
+    """
+    if settings.RAISE_ON_LAZY_LOAD:
+        return (load_only(*PRODUCT_RESPONSE_COLUMNS, raiseload=True), raiseload('*'))
+    return (load_only(*PRODUCT_RESPONSE_COLUMNS),)
 
 
 def _convert_product_json_fields(product: models.Product) -> dict:
@@ -39,19 +178,26 @@ def _convert_product_json_fields(product: models.Product) -> dict:
     return product_dict
 
 
-@router.get("/", response_model=List[schemas.Product])
+@router.get("/", response_model=List[schemas.Product], response_class=ORJSONResponse)
 def get_products(
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = Query(None, description="Keyset cursor: return products with id greater than this"),
     is_active: bool = None,
     product_type: str = None,
     search: str = Query(None, description="Search by name, description, or activation key"),
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get all products with optional filters. Only returns products for the current user's business."""
+    """Get all products with optional filters. Only returns products for the current user's business.
+    
+    Products are ordered by id. For deep pages pass the X-Next-After-Id header of the previous
+    page as after_id instead of a growing skip.
+    """
     business_id = get_business_id(current_user)
-    query = db.query(models.Product).filter(models.Product.business_id == business_id)
+    query = db.query(models.Product).options(*_product_list_options()).filter(
+        models.Product.business_id == business_id
+    )
     
     if is_active is not None:
         query = query.filter(models.Product.is_active == is_active)
@@ -72,11 +218,13 @@ def get_products(
         # Search in generated_keys
         # We need to check if any key in the JSON array matches
         matching_product_ids = []
-        all_products = db.query(models.Product).filter(models.Product.business_id == business_id).all()
+        all_products = db.query(models.Product.id, models.Product.generated_keys).filter(
+            models.Product.business_id == business_id
+        ).all()
         for p in all_products:
             if p.generated_keys:
                 try:
-                    keys_list = json.loads(p.generated_keys) if isinstance(p.generated_keys, str) else p.generated_keys
+                    keys_list = _decode_generated_keys(p.generated_keys)
                     if isinstance(keys_list, list):
                         for key_entry in keys_list:
                             if isinstance(key_entry, dict) and key_entry.get('key', '').lower().find(search.lower()) != -1:
@@ -93,8 +241,17 @@ def get_products(
         else:
             query = query.filter(name_desc_filter)
     
-    products = query.offset(skip).limit(limit).all()
-    return [_convert_product_json_fields(p) for p in products]
+    if after_id is not None:
+        query = query.filter(models.Product.id > after_id)
+    products = query.order_by(models.Product.id).offset(skip).limit(limit).all()
+    headers = {"X-Next-After-Id": str(products[-1].id)} if products and len(products) == limit else None
+    # The dicts are built from our own product rows, so they are trusted: model_construct skips
+    # validation (only use it for such internal data) and the list is serialized straight to
+    # JSON instead of FastAPI validating and encoding it again against response_model
+    return ORJSONResponse([
+        schemas.Product.model_construct(**_convert_product_json_fields(p)).model_dump(mode="json")
+        for p in products
+    ], headers=headers)
 
 
 @router.get("/{product_id}", response_model=schemas.Product)
@@ -161,25 +318,21 @@ def get_product_full_details(product_id: int, db: Session = Depends(get_db)):
             from app.services.config_validator import ConfigurationError, format_config_error_response
             business_id = product.business_id  # Use product's business_id
             yandex_api = YandexMarketAPI(business_id=business_id, db=db)
-            yandex_products = yandex_api.get_products()
             
             # Find matching product in Yandex
-            for yandex_product in yandex_products:
-                if (yandex_product.get("id") == product.yandex_market_id or 
-                    yandex_product.get("sku") == product.yandex_market_sku):
-                    # Log the raw Yandex product data for this specific product
-                    import json
-                    print("=" * 80)
-                    print(f"RAW YANDEX API RESPONSE FOR PRODUCT {product.yandex_market_id}:")
-                    print("=" * 80)
-                    print(json.dumps(yandex_product, indent=2, ensure_ascii=False))
-                    print("=" * 80)
-                    
-                    # Store basic offer data first
-                    product.yandex_full_data = yandex_product
-                    product_dict["yandex_full_data"] = yandex_product
-                    db.commit()
-                    break
+            yandex_product = _find_yandex_product(yandex_api, business_id, product.yandex_market_id, product.yandex_market_sku)
+            if yandex_product:
+                # Log the raw Yandex product data for this specific product
+                print("=" * 80)
+                print(f"RAW YANDEX API RESPONSE FOR PRODUCT {product.yandex_market_id}:")
+                print("=" * 80)
+                print(json.dumps(yandex_product, indent=2, ensure_ascii=False))
+                print("=" * 80)
+                
+                # Store basic offer data first
+                product.yandex_full_data = yandex_product
+                product_dict["yandex_full_data"] = yandex_product
+                db.commit()
             
             # Also fetch full product card details (name, description, images, videos, characteristics)
             if product.yandex_market_id:
@@ -214,6 +367,7 @@ def get_product_full_details(product_id: int, db: Session = Depends(get_db)):
 def update_product(
     product_id: int,
     product_update: schemas.ProductUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -221,9 +375,9 @@ def update_product(
     
     Process:
     1. Update local database
-    2. If product is synced with Yandex, push changes to Yandex
-    3. Immediately sync back from Yandex to get confirmed values
-    4. Result: Local and Yandex have the same values
+    2. If product is synced with Yandex, push changes to Yandex after the response is sent
+    3. Then sync back from Yandex to get confirmed values
+    4. Result: Local and Yandex have the same values; poll GET /{product_id}/sync-status for steps 2-3
     """
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not db_product:
@@ -240,9 +394,10 @@ def update_product(
     has_yandex_updates = yandex_field_updates and len(yandex_field_updates) > 0
     
     if has_yandex_updates and db_product.yandex_full_data:
-        # Update the stored Yandex JSON with new values
+        # Update the stored Yandex JSON with new values (assign a new dict - in-place changes
+        # to a JSONB value are not detected by the session and would not be saved)
         if isinstance(db_product.yandex_full_data, dict):
-            db_product.yandex_full_data.update(yandex_field_updates)
+            db_product.yandex_full_data = {**db_product.yandex_full_data, **yandex_field_updates}
         else:
             db_product.yandex_full_data = yandex_field_updates
     
@@ -252,63 +407,32 @@ def update_product(
         if field in update_data:
             setattr(db_product, field, update_data[field])
     
+    # Flush before committing: the UPDATE returns the new updated_at (eager_defaults), so the
+    # response is built from the instance as is instead of re-selecting the row after the commit
+    db.flush()
+    response = _convert_product_json_fields(db_product)
+    db.commit()
+    
     # If product is synced with Yandex and we have Yandex field updates, push changes
+    # in the background so the response doesn't wait on the Yandex round trips
     if is_synced and has_yandex_updates:
-        try:
-            from app.services.config_validator import ConfigurationError, format_config_error_response
-            from app.auth import get_business_id
-            business_id = db_product.business_id  # Use product's business_id
-            yandex_api = YandexMarketAPI(business_id=business_id, db=db)
-            
-            # Step 1: Push updates to Yandex using yandex_field_updates
-            yandex_api.update_product(db_product, field_updates=yandex_field_updates)
-            
-            # Step 2: Sync back from Yandex to get confirmed values
-            yandex_products = yandex_api.get_products()
-            for yandex_product in yandex_products:
-                if (yandex_product.get("id") == db_product.yandex_market_id or 
-                    yandex_product.get("sku") == db_product.yandex_market_sku):
-                    # Preserve local-only fields
-                    preserved_cost_price = db_product.cost_price
-                    preserved_supplier_url = db_product.supplier_url
-                    preserved_supplier_name = db_product.supplier_name
-                    preserved_email_template_id = db_product.email_template_id
-                    preserved_documentation_id = db_product.documentation_id
-                    
-                    # Update yandex_full_data with latest from Yandex (merge our updates)
-                    if isinstance(db_product.yandex_full_data, dict):
-                        # Merge Yandex response with our updates
-                        db_product.yandex_full_data = {**yandex_product, **yandex_field_updates}
-                    else:
-                        db_product.yandex_full_data = {**yandex_product, **yandex_field_updates}
-                    
-                    # Update basic fields from Yandex
-                    db_product.name = yandex_product.get("name", db_product.name)
-                    db_product.description = yandex_product.get("description", db_product.description)
-                    db_product.selling_price = yandex_product.get("price", db_product.selling_price)
-                    
-                    # Restore preserved local-only fields
-                    db_product.cost_price = preserved_cost_price
-                    db_product.supplier_url = preserved_supplier_url
-                    db_product.supplier_name = preserved_supplier_name
-                    db_product.email_template_id = preserved_email_template_id
-                    db_product.documentation_id = preserved_documentation_id
-                    
-                    db_product.is_synced = True
-                    break
-        except Exception as e:
-            # If Yandex update fails, still save local changes but mark as not synced
-            db_product.is_synced = False
-            db.commit()
-            db.refresh(db_product)
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Product updated locally but failed to sync to Yandex: {str(e)}"
-            )
+        _set_yandex_sync_state(product_id, "pending")
+        background_tasks.add_task(_reconcile_yandex, product_id, yandex_field_updates)
     
-    db.commit()
-    db.refresh(db_product)
-    return _convert_product_json_fields(db_product)
+    return response
+
+
+@router.get("/{product_id}/sync-status", response_model=dict)
+def get_product_sync_status(product_id: int, db: Session = Depends(get_db)):
+    """Get the state of the last Yandex push started by an update: pending, synced, failed or not_synced"""
+    product = db.get(models.Product, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    with _yandex_sync_lock:
+        state, error = _yandex_sync_state.get(product_id, (None, None))
+    if state is None:
+        state = "synced" if product.is_synced else "not_synced"
+    return {"product_id": product_id, "state": state, "is_synced": product.is_synced, "error": error}
 
 
 @router.get("/{product_id}/analytics", response_model=schemas.ProductAnalytics)
@@ -321,15 +445,18 @@ def get_product_analytics(product_id: int, db: Session = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Get all orders for this product
-    orders = db.query(models.Order).filter(models.Order.product_id == product_id).all()
-    completed_orders = [o for o in orders if o.status == models.OrderStatus.COMPLETED]
+    # Count and sum in the database instead of loading every order row for this product
+    is_completed = models.Order.status == models.OrderStatus.COMPLETED
+    total_orders, completed_count, total_revenue, completed_quantity = db.query(
+        func.count(models.Order.id),
+        func.count(models.Order.id).filter(is_completed),
+        func.coalesce(func.sum(models.Order.total_amount).filter(is_completed), 0.0),
+        func.coalesce(func.sum(models.Order.quantity).filter(is_completed), 0),
+    ).filter(models.Order.product_id == product_id).one()
     
-    # Calculate metrics
-    total_orders = len(orders)
-    completed_count = len(completed_orders)
-    total_revenue = sum(o.total_amount for o in completed_orders)
-    total_profit = sum(o.profit for o in completed_orders)
+    # Calculate metrics (Order.profit is total_amount - cost_price * quantity, and every
+    # order here is for this product, so the per-order profits sum to this)
+    total_profit = total_revenue - (product.cost_price * completed_quantity)
     profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
     average_order_value = total_revenue / completed_count if completed_count > 0 else 0
     
@@ -357,7 +484,6 @@ def generate_activation_keys(
     db: Session = Depends(get_db)
 ):
     """Generate activation keys for a product"""
-    import json
     from datetime import datetime
     
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -368,47 +494,44 @@ def generate_activation_keys(
         raise HTTPException(status_code=400, detail="Only digital products can have activation keys")
     
     import secrets
-    keys_created = []
-    generated_keys_list = []
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
     
-    # Get existing generated_keys from product
-    existing_keys = []
-    if product.generated_keys:
-        try:
-            existing_keys = json.loads(product.generated_keys) if isinstance(product.generated_keys, str) else product.generated_keys
-        except:
-            existing_keys = []
+    # Get existing generated_keys from product (None if the stored value can't be read)
+    existing_keys = _decode_generated_keys(product.generated_keys)
+    existing_key_set = {k.get('key') for k in existing_keys or [] if isinstance(k, dict)}
     
-    for _ in range(count):
-        # Generate a unique key
-        key = f"{product.yandex_market_sku or product.id}-{secrets.token_urlsafe(16)}"
-        
-        # Check if key already exists in ActivationKey table
-        existing = db.query(models.ActivationKey).filter(models.ActivationKey.key == key).first()
-        if existing:
-            continue
-        
-        # Check if key already exists in product.generated_keys
-        if any(k.get('key') == key for k in existing_keys):
-            continue
-        
-        activation_key = models.ActivationKey(
-            product_id=product_id,
-            key=key
-        )
-        db.add(activation_key)
-        keys_created.append(key)
-        
-        # Add to generated_keys list
-        generated_keys_list.append({
+    # Generate all keys up front and insert them in one statement; the unique index on
+    # activation_keys.key drops any (astronomically unlikely) collision instead of a SELECT per key
+    key_prefix = product.yandex_market_sku or product.id
+    candidate_keys = [f"{key_prefix}-{secrets.token_urlsafe(16)}" for _ in range(count)]
+    candidate_keys = [key for key in candidate_keys if key not in existing_key_set]
+    keys_created = []
+    if candidate_keys:
+        inserted = set(db.execute(
+            pg_insert(models.ActivationKey)
+            .values([{"product_id": product_id, "key": key} for key in candidate_keys])
+            .on_conflict_do_nothing(index_elements=["key"])
+            .returning(models.ActivationKey.key)
+        ).scalars())
+        keys_created = [key for key in candidate_keys if key in inserted]
+    
+    # Add to generated_keys list
+    timestamp = datetime.utcnow().isoformat()
+    generated_keys_list = [
+        {
             "key": key,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp,
             "order_id": None  # Will be updated when used
-        })
+        }
+        for key in keys_created
+    ]
     
-    # Update product.generated_keys with new keys
-    all_keys = existing_keys + generated_keys_list
-    product.generated_keys = json.dumps(all_keys)
+    # Update product.generated_keys with new keys (a new list, so the change is detected).
+    # An unreadable stored value is left as it is rather than replaced by the new keys alone.
+    if existing_keys is None:
+        logger.warning("Product %s has unreadable generated_keys - not updating them", product_id)
+    else:
+        product.generated_keys = existing_keys + generated_keys_list
     
     db.commit()
     return {"success": True, "keys_created": len(keys_created), "keys": keys_created}
@@ -4,26 +4,30 @@ from app.database import get_db
 from app import models, schemas
 from app.services.order_service import OrderService
 from typing import Dict, Any
+from functools import lru_cache
 
 router = APIRouter()
 
+# Yandex Market order status -> our OrderStatus (anything else maps to PENDING)
+YANDEX_STATUS_MAPPING = {
+    "PROCESSING": models.OrderStatus.PROCESSING,
+    "DELIVERY": models.OrderStatus.PROCESSING,
+    "DELIVERED": models.OrderStatus.COMPLETED,
+    "CANCELLED": models.OrderStatus.CANCELLED,
+    "CANCELLED_IN_PROCESSING": models.OrderStatus.CANCELLED,
+    "CANCELLED_IN_DELIVERY": models.OrderStatus.CANCELLED,
+    "PENDING": models.OrderStatus.PENDING,
+    "UNPAID": models.OrderStatus.PENDING,
+    "RESERVED": models.OrderStatus.PENDING,
+}
 
+
+@lru_cache(maxsize=64)
 def _map_yandex_status(yandex_status: str) -> models.OrderStatus:
     """Map Yandex Market order status to our OrderStatus enum"""
     if not yandex_status:
         return models.OrderStatus.PENDING
-    status_mapping = {
-        "PROCESSING": models.OrderStatus.PROCESSING,
-        "DELIVERY": models.OrderStatus.PROCESSING,
-        "DELIVERED": models.OrderStatus.COMPLETED,
-        "CANCELLED": models.OrderStatus.CANCELLED,
-        "CANCELLED_IN_PROCESSING": models.OrderStatus.CANCELLED,
-        "CANCELLED_IN_DELIVERY": models.OrderStatus.CANCELLED,
-        "PENDING": models.OrderStatus.PENDING,
-        "UNPAID": models.OrderStatus.PENDING,
-        "RESERVED": models.OrderStatus.PENDING,
-    }
-    return status_mapping.get(yandex_status.upper(), models.OrderStatus.PENDING)
+    return YANDEX_STATUS_MAPPING.get(yandex_status.upper(), models.OrderStatus.PENDING)
 
 
 @router.post("/yandex-market/orders")
@@ -337,6 +337,21 @@ class MarketingEmailTemplate(MarketingEmailTemplateBase):
         from_attributes = True
 
 
+class BroadcastJob(BaseModel):
+    id: str
+    template_id: int
+    status: str  # queued, running, completed, failed
+    total_count: int = 0
+    sent_count: int = 0
+    failed_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
 # Documentation Schemas
 class DocumentationBase(BaseModel):
     name: str
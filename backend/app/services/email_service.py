@@ -1,3 +1,4 @@
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -7,6 +8,8 @@ from typing import Optional
 from app import models
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class EmailService:
     """Service for sending emails"""
@@ -44,6 +47,13 @@ class EmailService:
             if close_db:
                 db.close()
     
+    def open_smtp_connection(self) -> smtplib.SMTP:
+        """Open an authenticated SMTP connection that can be reused for several sends"""
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+        server.starttls()
+        server.login(self.smtp_user, self.smtp_password)
+        return server
+    
     def _get_email_template(self, order: models.Order, db) -> str:
         """Get email template for order"""
         # Get product using query
@@ -235,12 +245,44 @@ class EmailService:
             print(traceback.format_exc())
             return {"success": False, "message": f"Failed to send email: {str(e)}"}
     
+    def download_attachments(self, attachments: list) -> list:
+        """Download attachment files once so they can be attached to many emails
+        
+        Args:
+            attachments: List of attachment dicts with 'url', 'type', 'name'
+        
+        Returns:
+            List of (name, content) pairs; attachments that fail to download are skipped
+        """
+        import requests
+        
+        files = []
+        for attachment in attachments:
+            try:
+                # Download attachment if it's a URL
+                if attachment.get("url"):
+                    url = attachment["url"]
+                    # If it's a relative URL, make it absolute
+                    if url.startswith("/"):
+                        # Assume it's a media file from our server
+                        url = f"{settings.PUBLIC_URL}{url}"
+                    
+                    response = requests.get(url, timeout=10)
+                    if response.status_code == 200:
+                        files.append((attachment.get("name", "attachment"), response.content))
+            except Exception as e:
+                logger.warning("Could not attach %s: %s", attachment.get('name', 'file'), e)
+                continue
+        return files
+    
     def send_marketing_email(
         self, 
         to_email: str, 
         subject: str, 
         body: str, 
-        attachments: Optional[list] = None
+        attachments: Optional[list] = None,
+        smtp_connection: Optional[smtplib.SMTP] = None,
+        attachment_files: Optional[list] = None
     ) -> dict:
         """Send a marketing email to a client
         
@@ -249,6 +291,10 @@ class EmailService:
             subject: Email subject
             body: Email body (HTML)
             attachments: Optional list of attachment dicts with 'url', 'type', 'name'
+            smtp_connection: Optional connection from open_smtp_connection() to send over
+                instead of opening a new one (used by bulk broadcasts)
+            attachment_files: Optional (name, content) pairs from download_attachments(),
+                used instead of downloading `attachments` again for every recipient
         
         Returns:
             dict with 'success' and 'message' keys
@@ -262,58 +308,42 @@ class EmailService:
             msg.attach(MIMEText(body, "html"))
             
             # Handle attachments if provided
-            if attachments:
+            if attachments and attachment_files is None:
+                attachment_files = self.download_attachments(attachments)
+            if attachment_files:
                 from email.mime.base import MIMEBase
                 from email import encoders
-                import requests
-                import os
-                from pathlib import Path
                 
-                for attachment in attachments:
-                    try:
-                        # Download attachment if it's a URL
-                        if attachment.get("url"):
-                            url = attachment["url"]
-                            # If it's a relative URL, make it absolute
-                            if url.startswith("/"):
-                                # Assume it's a media file from our server
-                                from app.config import settings
-                                url = f"{settings.PUBLIC_URL}{url}"
-                            
-                            response = requests.get(url, timeout=10)
-                            if response.status_code == 200:
-                                attachment_part = MIMEBase('application', 'octet-stream')
-                                attachment_part.set_payload(response.content)
-                                encoders.encode_base64(attachment_part)
-                                attachment_part.add_header(
-                                    'Content-Disposition',
-                                    f'attachment; filename= {attachment.get("name", "attachment")}'
-                                )
-                                msg.attach(attachment_part)
-                    except Exception as e:
-                        print(f"⚠️  Warning: Could not attach {attachment.get('name', 'file')}: {str(e)}")
-                        continue
+                for name, content in attachment_files:
+                    attachment_part = MIMEBase('application', 'octet-stream')
+                    attachment_part.set_payload(content)
+                    encoders.encode_base64(attachment_part)
+                    attachment_part.add_header(
+                        'Content-Disposition',
+                        f'attachment; filename= {name}'
+                    )
+                    msg.attach(attachment_part)
             
             if not self.smtp_host or not self.smtp_user:
                 # In development, just log the email
-                print(f"📧 Email would be sent to {to_email}")
-                print(f"   Subject: {subject}")
-                print(f"   Body length: {len(body)} characters")
-                if attachments:
-                    print(f"   Attachments: {len(attachments)} file(s)")
+                logger.info(
+                    "Email would be sent to %s (subject: %s, body: %s characters, attachments: %s)",
+                    to_email, subject, len(body), len(attachments) if attachments else 0
+                )
                 return {
                     "success": True, 
                     "message": "Email logged (SMTP not configured). Configure SMTP_HOST, SMTP_USER, and SMTP_PASSWORD in .env to send actual emails."
                 }
             
-            with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+            if smtp_connection is not None:
+                smtp_connection.send_message(msg)
+            else:
+                with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30) as server:
+                    server.starttls()
+                    server.login(self.smtp_user, self.smtp_password)
+                    server.send_message(msg)
             
             return {"success": True, "message": "Marketing email sent successfully"}
         except Exception as e:
-            import traceback
-            print(f"⚠️  Error sending marketing email to {to_email}: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error sending marketing email to %s: %s", to_email, e)
             return {"success": False, "message": f"Failed to send email: {str(e)}"}
\ No newline at end of file
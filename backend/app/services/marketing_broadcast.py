@@ -0,0 +1,300 @@
+"""
+Background sending for marketing email broadcasts.
+
+The broadcast endpoint only selects recipients and hands them to these functions,
+which run after the response has been returned and open their own database session.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, NamedTuple
+from jinja2 import Template as JinjaTemplate
+from app import models
+from app.database import SessionLocal
+from app.services.email_service import EmailService
+
+logger = logging.getLogger(__name__)
+
+# Number of SMTP connections a single broadcast sends over concurrently
+SMTP_POOL_SIZE = 8
+# Maximum number of failed recipients listed in a broadcast's failure summary
+FAILED_LOG_LIMIT = 20
+# Number of client IDs loaded per query when resolving broadcast recipients
+CLIENT_CHUNK_SIZE = 1000
+
+# Read-through cache of marketing templates for the broadcast path, keyed by template id.
+# Templates are rarely edited; update/delete invalidate their entry, and entries expire
+# after the TTL so other server processes pick up changes too.
+TEMPLATE_CACHE_TTL_SECONDS = 60
+TEMPLATE_CACHE_MAX_SIZE = 512
+
+
+class CachedTemplate(NamedTuple):
+    """Detached copy of the MarketingEmailTemplate columns a broadcast needs"""
+    id: int
+    business_id: int
+    name: str
+    subject: str
+    body: str
+    attachments: Optional[list]
+    is_default: bool
+
+
+_template_cache: Dict[int, Tuple[float, CachedTemplate]] = {}
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cached(db, template_id: int) -> Optional[CachedTemplate]:
+    """Get a marketing template by id, from the cache if a fresh entry exists"""
+    now = time.monotonic()
+    with _template_cache_lock:
+        entry = _template_cache.get(template_id)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    template = db.get(models.MarketingEmailTemplate, template_id)
+    if not template:
+        return None
+
+    cached = CachedTemplate(
+        id=template.id,
+        business_id=template.business_id,
+        name=template.name,
+        subject=template.subject,
+        body=template.body,
+        attachments=template.attachments,
+        is_default=template.is_default,
+    )
+    with _template_cache_lock:
+        if len(_template_cache) >= TEMPLATE_CACHE_MAX_SIZE:
+            # Drop the entry closest to expiry to make room
+            oldest_id = min(_template_cache, key=lambda tid: _template_cache[tid][0])
+            _template_cache.pop(oldest_id, None)
+        _template_cache[template_id] = (now + TEMPLATE_CACHE_TTL_SECONDS, cached)
+    return cached
+
+
+def invalidate_template_cache(template_id: int):
+    """Forget a cached template after it was updated or deleted"""
+    with _template_cache_lock:
+        _template_cache.pop(template_id, None)
+
+
+def _get_template(db, business_id: int, template_id: int) -> Optional[CachedTemplate]:
+    template = get_template_cached(db, template_id)
+    if not template or template.business_id != business_id:
+        return None
+    return template
+
+
+def _update_job(db, job_id: str, **fields):
+    """Record broadcast progress on its BroadcastJob row"""
+    job = db.get(models.BroadcastJob, job_id)
+    if not job:
+        return
+    for field, value in fields.items():
+        setattr(job, field, value)
+    db.commit()
+
+
+def _fail_job(db, job_id: str, error: str):
+    db.rollback()
+    _update_job(db, job_id, status="failed", error=error, finished_at=datetime.utcnow())
+
+
+def _send_pooled(
+    email_service: EmailService,
+    messages: List[Tuple[str, str, str]],
+    attachments: Optional[list] = None
+) -> Tuple[int, int]:
+    """Send (to_email, subject, body) messages over a bounded pool of SMTP connections.
+
+    Each connection is opened (STARTTLS + login) once and reused for many messages.
+    A connection that fails a send is closed and reopened on its next checkout
+    instead of aborting the rest of the batch. Attachments are downloaded once and
+    attached to every message.
+
+    Returns:
+        (sent_count, failed_count)
+    """
+    if not messages:
+        return 0, 0
+
+    smtp_configured = bool(email_service.smtp_host and email_service.smtp_user)
+    attachment_files = email_service.download_attachments(attachments) if attachments else None
+    pool_size = min(SMTP_POOL_SIZE, len(messages))
+    connections = queue.Queue()
+    for _ in range(pool_size):
+        connections.put(None)  # Opened lazily by the first send that checks it out
+
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def send_one(message) -> dict:
+        to_email, subject, body = message
+        server = connections.get()
+        try:
+            if server is None and smtp_configured:
+                server = email_service.open_smtp_connection()
+            result = email_service.send_marketing_email(
+                to_email=to_email,
+                subject=subject,
+                body=body,
+                smtp_connection=server,
+                attachment_files=attachment_files
+            )
+        except Exception as e:
+            result = {"success": False, "message": str(e)}
+
+        if not result.get("success") and server is not None:
+            # Recycle the connection - the server may have dropped it
+            _close(server)
+            server = None
+        connections.put(server)
+        return result
+
+    with ThreadPoolExecutor(max_workers=pool_size) as pool:
+        results = list(pool.map(send_one, messages))
+
+    while not connections.empty():
+        server = connections.get()
+        if server is not None:
+            _close(server)
+
+    # Aggregate once over the collected results instead of inside the send threads
+    failed = [
+        (message[0], result.get("message", "Unknown error"))
+        for message, result in zip(messages, results)
+        if not result.get("success")
+    ]
+    if failed:
+        logger.warning(
+            "Failed to send %s of %s emails (first %s: %s)",
+            len(failed), len(results), min(len(failed), FAILED_LOG_LIMIT), failed[:FAILED_LOG_LIMIT]
+        )
+    return len(results) - len(failed), len(failed)
+
+
+@lru_cache(maxsize=64)
+def _compile_template(template_body: str) -> JinjaTemplate:
+    """Compile a template body once and reuse it across recipients and broadcasts.
+
+    Keyed by the body text itself, so an edited template is simply a new cache entry.
+    """
+    return JinjaTemplate(template_body)
+
+
+def _render_default_bodies(template_body: str, recipients: List[Dict]) -> List[str]:
+    """Render one email body per recipient from the compiled default template"""
+    jinja_template = _compile_template(template_body)
+    return [
+        jinja_template.render(
+            client_name=recipient["name"],
+            expired_products=recipient["expired_products"],
+            additional_info=template_body  # Include the template body as additional info
+        )
+        for recipient in recipients
+    ]
+
+
+
+def send_broadcast(job_id: str, business_id: int, template_id: int, client_ids: List[int], filter_descriptions: List[str]):
+    """Send a regular marketing template to the given clients.
+
+    Args:
+        job_id: Identifier returned to the caller, used to correlate log output
+        business_id: Business that owns the template and clients
+        template_id: Marketing email template to send
+        client_ids: IDs of the clients selected by the broadcast filters
+        filter_descriptions: Human-readable filters, for logging only
+    """
+    db = SessionLocal()
+    try:
+        template = _get_template(db, business_id, template_id)
+        if not template:
+            logger.warning("[Broadcast %s] Template %s no longer exists - nothing sent", job_id, template_id)
+            _fail_job(db, job_id, "Template no longer exists")
+            return
+
+        _update_job(db, job_id, status="running")
+        email_service = EmailService(business_id=business_id, db=db)
+        messages = []
+        # Load recipients in chunks, and only the columns needed to address them
+        for start in range(0, len(client_ids), CLIENT_CHUNK_SIZE):
+            chunk = client_ids[start:start + CLIENT_CHUNK_SIZE]
+            rows = db.query(models.Client.id, models.Client.name, models.Client.email).filter(
+                models.Client.id.in_(chunk)
+            ).all()
+            for client_id, client_name, client_email in rows:
+                if not client_email:
+                    logger.warning("Skipping client %s (%s) - no email address", client_id, client_name)
+                    continue
+                messages.append((client_email, template.subject, template.body))
+
+        sent_count, failed_count = _send_pooled(email_service, messages, template.attachments)
+
+        _update_job(
+            db, job_id, status="completed", sent_count=sent_count, failed_count=failed_count,
+            finished_at=datetime.utcnow()
+        )
+        filter_msg = f" ({', '.join(filter_descriptions)})" if filter_descriptions else ""
+        logger.info("[Broadcast %s] Email broadcast completed%s: %s sent, %s failed", job_id, filter_msg, sent_count, failed_count)
+    except Exception as e:
+        logger.exception("[Broadcast %s] Broadcast failed: %s", job_id, e)
+        try:
+            _fail_job(db, job_id, str(e))
+        except Exception as job_error:
+            logger.warning("[Broadcast %s] Could not record failure: %s", job_id, job_error)
+    finally:
+        db.close()
+
+
+def send_default_broadcast(job_id: str, business_id: int, template_id: int, recipients: List[Dict]):
+    """Send the default template, rendered per client with their expired products.
+
+    Args:
+        job_id: Identifier returned to the caller, used to correlate log output
+        business_id: Business that owns the template
+        template_id: Default marketing email template
+        recipients: One dict per client: {"email", "name", "expired_products": [{"name", "purchase_link", "expired_date"}]}
+    """
+    db = SessionLocal()
+    try:
+        template = _get_template(db, business_id, template_id)
+        if not template:
+            logger.warning("[Broadcast %s] Template %s no longer exists - nothing sent", job_id, template_id)
+            _fail_job(db, job_id, "Template no longer exists")
+            return
+
+        _update_job(db, job_id, status="running")
+        email_service = EmailService(business_id=business_id, db=db)
+
+        # Render template with client-specific data, then send over the SMTP pool
+        email_bodies = _render_default_bodies(template.body, recipients)
+        messages = [
+            (recipient["email"], template.subject, email_body)
+            for recipient, email_body in zip(recipients, email_bodies)
+        ]
+
+        sent_count, failed_count = _send_pooled(email_service, messages, template.attachments)
+
+        _update_job(
+            db, job_id, status="completed", sent_count=sent_count, failed_count=failed_count,
+            finished_at=datetime.utcnow()
+        )
+        logger.info("[Broadcast %s] Default template broadcast completed: %s sent, %s failed", job_id, sent_count, failed_count)
+    except Exception as e:
+        logger.exception("[Broadcast %s] Broadcast failed: %s", job_id, e)
+        try:
+            _fail_job(db, job_id, str(e))
+        except Exception as job_error:
+            logger.warning("[Broadcast %s] Could not record failure: %s", job_id, job_error)
+    finally:
+        db.close()
@@ -1,9 +1,29 @@
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+import logging
+import orjson
 from app import models
 from app.services.yandex_api import YandexMarketAPI
 
+logger = logging.getLogger(__name__)
+
+
+def _decode_generated_keys(value) -> Optional[list]:
+    """Read products.generated_keys as a list (None if it can't be decoded into one)
+    
+    Rows not yet converted by the convert_products_generated_keys_to_arrays migration still
+    hold a JSON string.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+    return value if isinstance(value, list) else None
+
 
 class OrderService:
     """Service for handling order fulfillment"""
@@ -112,7 +132,6 @@ class OrderService:
         if not activation_key:
             # Generate a new key if none available
             import secrets
-            import json
             key = f"{product.yandex_market_sku or product.id}-{secrets.token_urlsafe(16)}"
             activation_key = models.ActivationKey(
                 product_id=order.product_id,
@@ -121,20 +140,17 @@ class OrderService:
             self.db.add(activation_key)
             self.db.flush()
             
-            # Add to product.generated_keys
-            existing_keys = []
-            if product.generated_keys:
-                try:
-                    existing_keys = json.loads(product.generated_keys) if isinstance(product.generated_keys, str) else product.generated_keys
-                except:
-                    existing_keys = []
-            
-            existing_keys.append({
-                "key": key,
-                "timestamp": datetime.utcnow().isoformat(),
-                "order_id": order.id
-            })
-            product.generated_keys = json.dumps(existing_keys)
+            # Add to product.generated_keys (a new list, so the change is detected); an
+            # unreadable stored value is left as it is rather than replaced by this key alone
+            existing_keys = _decode_generated_keys(product.generated_keys)
+            if existing_keys is None:
+                logger.warning("Product %s has unreadable generated_keys - not updating them", product.id)
+            else:
+                product.generated_keys = existing_keys + [{
+                    "key": key,
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "order_id": order.id
+                }]
         
         # Assign key to order
         order.activation_key_id = activation_key.id
@@ -142,16 +158,15 @@ class OrderService:
         activation_key.used_at = datetime.utcnow()
         
         # Update the key's order_id in product.generated_keys
-        if product.generated_keys:
-            try:
-                existing_keys = json.loads(product.generated_keys) if isinstance(product.generated_keys, str) else product.generated_keys
-                for key_entry in existing_keys:
-                    if key_entry.get('key') == activation_key.key:
-                        key_entry['order_id'] = order.id
-                        break
-                product.generated_keys = json.dumps(existing_keys)
-            except:
-                pass
+        existing_keys = _decode_generated_keys(product.generated_keys)
+        if existing_keys:
+            # Copy the entries: JSONB values changed in place are not saved
+            existing_keys = [dict(k) if isinstance(k, dict) else k for k in existing_keys]
+            for key_entry in existing_keys:
+                if isinstance(key_entry, dict) and key_entry.get('key') == activation_key.key:
+                    key_entry['order_id'] = order.id
+                    break
+            product.generated_keys = existing_keys
         
         # Update order status
         order.status = models.OrderStatus.PROCESSING
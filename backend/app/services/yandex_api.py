@@ -1,6 +1,8 @@
 import httpx
 import json
 import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Optional
 from urllib.parse import urlparse
@@ -8,6 +10,49 @@ from app.config import settings
 from app import models
 from app.database import SessionLocal
 
+# One HTTP client for all Yandex API calls so TCP/TLS connections are kept alive and reused
+# (httpx.Client is thread-safe; default 5s timeout as before, requests may override it)
+_http_client = httpx.Client(
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+)
+
+
+@contextmanager
+def _pooled_client():
+    """Yield the shared HTTP client (replaces per-call `with httpx.Client()`, without closing it)"""
+    yield _http_client
+
+
+def close_http_client():
+    """Close the shared HTTP client (called on app shutdown)"""
+    _http_client.close()
+
+
+# Products listing URL -> (ETag, decoded products) of the last catalog download, so
+# get_products can revalidate with If-None-Match instead of downloading it again
+_products_etag_cache: Dict[str, tuple] = {}
+_products_etag_lock = threading.Lock()
+
+
+def _conditional_products_request(headers: Dict[str, str], url: str) -> tuple:
+    """Headers for a products listing request (with If-None-Match if its catalog is cached),
+    and the cached catalog to use when the answer is 304 Not Modified (None if not cached)"""
+    with _products_etag_lock:
+        cached = _products_etag_cache.get(url)
+    if not cached:
+        return headers, None
+    return {**headers, "If-None-Match": cached[0]}, cached[1]
+
+
+def _cache_products(url: str, response: httpx.Response, products: List[Dict]):
+    """Remember a downloaded catalog if the response carries an ETag"""
+    etag = response.headers.get("ETag")
+    with _products_etag_lock:
+        if etag:
+            _products_etag_cache[url] = (etag, products)
+        else:
+            _products_etag_cache.pop(url, None)
+
 
 class YandexMarketAPI:
     """Service for interacting with Yandex Market Partner API"""
@@ -95,10 +140,12 @@ class YandexMarketAPI:
     def _make_request(self, method: str, url: str, **kwargs) -> httpx.Response:
         """Make HTTP request with error logging"""
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.request(method, url, **kwargs)
                 # Log error responses for debugging
-                if response.status_code in [401, 403]:
+                if response.status_code == 304:
+                    pass  # Not Modified - a conditional request was answered from our cache
+                elif response.status_code in [401, 403]:
                     print(f"Authentication error ({response.status_code}) for {method} {url}")
                     print(f"Response: {response.text}")
                     print(f"Headers sent: {kwargs.get('headers', {})}")
@@ -228,7 +275,7 @@ class YandexMarketAPI:
             }
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -398,7 +445,7 @@ class YandexMarketAPI:
             }
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 # Both APIs use POST for updates
                 response = client.post(
                     url,
@@ -412,7 +459,11 @@ class YandexMarketAPI:
             raise Exception(f"Failed to update product on Yandex Market: {str(e)}")
     
     def get_products(self) -> List[Dict]:
-        """Get all products from Yandex Market"""
+        """Get all products from Yandex Market
+        
+        When the last download came with an ETag, the request is sent with If-None-Match and a
+        304 Not Modified returns the cached catalog instead of downloading and decoding it again.
+        """
         if self.is_acma_token:
             # Campaign API: Try POST /v2/campaigns/*/offers.json first (user's test code showed this works)
             # If that fails, try POST /v2/campaigns/*/offers (without .json)
@@ -430,7 +481,10 @@ class YandexMarketAPI:
             for url in urls_to_try:
                 try:
                     print(f"🔍 Fetching products from: {url}")
-                    response = self._make_request("POST", url, json=payload, headers=self._get_headers(), timeout=30.0)
+                    headers, cached_offers = _conditional_products_request(self._get_headers(), url)
+                    response = self._make_request("POST", url, json=payload, headers=headers, timeout=30.0)
+                    if response.status_code == 304 and cached_offers is not None:
+                        return cached_offers
                     response.raise_for_status()
                     data = response.json()
                     print(f"✅ Received response from Yandex API")
@@ -453,6 +507,7 @@ class YandexMarketAPI:
                         import json
                         print(json.dumps(offers, indent=2, ensure_ascii=False))
                         print("=" * 80)
+                    _cache_products(url, response, offers)
                     return offers
                 except httpx.HTTPError as e:
                     last_error = e
@@ -469,7 +524,10 @@ class YandexMarketAPI:
             # Business API uses POST to /offer-mappings (not GET)
             url = f"{self.base_url}/v2/businesses/{self.business_id}/offer-mappings"
             try:
-                response = self._make_request("POST", url, json={}, headers=self._get_headers(), timeout=30.0)
+                headers, cached_mappings = _conditional_products_request(self._get_headers(), url)
+                response = self._make_request("POST", url, json={}, headers=headers, timeout=30.0)
+                if response.status_code == 304 and cached_mappings is not None:
+                    return cached_mappings
                 response.raise_for_status()
                 data = response.json()
                 # Business API: result.offerMappingEntries
@@ -482,6 +540,7 @@ class YandexMarketAPI:
                     import json
                     print(json.dumps(offer_mappings, indent=2, ensure_ascii=False))
                     print("=" * 80)
+                _cache_products(url, response, offer_mappings)
                 return offer_mappings
             except httpx.HTTPError as e:
                 print(f"❌ Error getting products from Business API: {str(e)}")
@@ -714,7 +773,7 @@ class YandexMarketAPI:
             payload = None
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 if payload:
                     response = client.post(
                         url,
@@ -959,7 +1018,7 @@ class YandexMarketAPI:
         payload = {"text": reply_text, "gradeId": review_id}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1028,7 +1087,7 @@ class YandexMarketAPI:
         payload = {"text": reply_text, "gradeId": review_id}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1056,7 +1115,7 @@ class YandexMarketAPI:
         url = f"{self.base_url}/v2/businesses/{self.business_id}/chats"
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 # Use POST with orderIds filter in body (as per documentation)
                 # Note: API only allows ONE filter type - either orderIds, contextTypes, or contexts
                 payload = {
@@ -1135,7 +1194,7 @@ class YandexMarketAPI:
         chats_url = f"{self.base_url}/v2/businesses/{self.business_id}/chats"
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 # Get existing chat using POST with orderIds filter
                 # Note: API only allows ONE filter type - either orderIds, contextTypes, or contexts
                 payload = {
@@ -1198,7 +1257,7 @@ class YandexMarketAPI:
     def download_media_file(self, url: str, save_path: Path) -> str:
         """Download a media file from URL and save it locally"""
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.get(url, timeout=60.0, follow_redirects=True)
                 response.raise_for_status()
                 
@@ -1275,7 +1334,7 @@ class YandexMarketAPI:
         payload = {"skus": items}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.put(
                     url,
                     json=payload,
@@ -1298,7 +1357,7 @@ class YandexMarketAPI:
         payload = {"skus": items}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.put(
                     url,
                     json=payload,
@@ -1316,7 +1375,7 @@ class YandexMarketAPI:
         params = {"sku": shop_sku}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.get(
                     url,
                     params=params,
@@ -1351,7 +1410,7 @@ class YandexMarketAPI:
         payload = {"offers": items}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1386,7 +1445,7 @@ class YandexMarketAPI:
         payload = {"offers": items}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1471,7 +1530,7 @@ class YandexMarketAPI:
         }
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1492,7 +1551,7 @@ class YandexMarketAPI:
             url = f"{self.base_url}/v2/businesses/{self.business_id}/offer-mappings"
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.get(
                     url,
                     headers=self._get_headers(),
@@ -1513,7 +1572,7 @@ class YandexMarketAPI:
             url = f"{self.base_url}/v2/businesses/{self.business_id}/offer-mappings"
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.delete(
                     url,
                     headers=self._get_headers(),
@@ -1572,7 +1631,7 @@ class YandexMarketAPI:
         payload = {"offers": offers}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.post(
                     url,
                     json=payload,
@@ -1692,7 +1751,7 @@ class YandexMarketAPI:
         params = {"shopSku": shop_sku}
         
         try:
-            with httpx.Client() as client:
+            with _pooled_client() as client:
                 response = client.get(
                     url,
                     params=params,
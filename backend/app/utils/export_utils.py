@@ -1,8 +1,9 @@
 """Utilities for exporting content as TXT/PDF and extracting text from uploaded files."""
+import codecs
 import io
 import re
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union, BinaryIO
 
 from pypdf import PdfReader
 from reportlab.lib.pagesizes import letter
@@ -12,25 +13,40 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.enums import TA_LEFT
 
 
-def extract_text_from_file(content: bytes, filename: str) -> str:
-    """Extract plain text from uploaded TXT or PDF file."""
+# Read size when decoding uploaded text files incrementally
+TEXT_CHUNK_SIZE = 64 * 1024
+
+
+def extract_text_from_file(content: Union[bytes, BinaryIO], filename: str) -> str:
+    """Extract plain text from uploaded TXT or PDF file, given as bytes or a binary file object."""
+    if isinstance(content, (bytes, bytearray)):
+        content = io.BytesIO(content)
     name_lower = filename.lower() if filename else ""
     if name_lower.endswith(".pdf"):
         return _extract_text_from_pdf(content)
-    # Default: treat as text (utf-8, with fallbacks)
+    # Default: treat as text (utf-8, with latin-1 fallback)
+    return _decode_text(content)
+
+
+def _decode_text(fp: BinaryIO) -> str:
+    """Decode a text file in chunks as UTF-8, re-reading it as latin-1 if it is not valid UTF-8."""
+    start = fp.tell()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
     try:
-        return content.decode("utf-8")
+        while chunk := fp.read(TEXT_CHUNK_SIZE):
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
     except UnicodeDecodeError:
-        try:
-            return content.decode("latin-1")
-        except Exception:
-            return content.decode("utf-8", errors="replace")
+        fp.seek(start)
+        return fp.read().decode("latin-1")
+    return "".join(parts)
 
 
-def _extract_text_from_pdf(content: bytes) -> str:
-    """Extract text from PDF bytes."""
+def _extract_text_from_pdf(fp: BinaryIO) -> str:
+    """Extract text from a PDF file object."""
     try:
-        reader = PdfReader(io.BytesIO(content))
+        reader = PdfReader(fp)
         parts = []
         for page in reader.pages:
             text = page.extract_text()
@@ -75,6 +91,18 @@ def build_txt_marketing(name: str, subject: str, body: str) -> str:
     return f"# {name}\n\nSubject: {subject}\n\n{strip_html(body)}"
 
 
+# PDF paragraph styles are immutable once built, so they are created once at import and shared
+_PDF_STYLES = getSampleStyleSheet()
+_PDF_TITLE_STYLE = _PDF_STYLES["Heading1"]
+_PDF_BODY_STYLE = ParagraphStyle(
+    name="Body",
+    parent=_PDF_STYLES["Normal"],
+    fontSize=11,
+    leading=14,
+    alignment=TA_LEFT,
+)
+
+
 def build_pdf_bytes(title: str, body_plain: str) -> bytes:
     """Generate PDF bytes from a title and plain text body."""
     buffer = io.BytesIO()
@@ -86,22 +114,13 @@ def build_pdf_bytes(title: str, body_plain: str) -> bytes:
         topMargin=inch,
         bottomMargin=inch,
     )
-    styles = getSampleStyleSheet()
-    custom = ParagraphStyle(
-        name="Body",
-        parent=styles["Normal"],
-        fontSize=11,
-        leading=14,
-        alignment=TA_LEFT,
-    )
     story = []
-    story.append(Paragraph(title.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"), styles["Heading1"]))
+    story.append(Paragraph(title.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"), _PDF_TITLE_STYLE))
     story.append(Spacer(1, 0.2 * inch))
     for para in body_plain.split("\n\n"):
         para = (para or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
         if para.strip():
-            story.append(Paragraph(para.replace("\n", "<br/>"), custom))
+            story.append(Paragraph(para.replace("\n", "<br/>"), _PDF_BODY_STYLE))
             story.append(Spacer(1, 0.1 * inch))
     doc.build(story)
-    buffer.seek(0)
-    return buffer.read()
+    return buffer.getvalue()
@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the backend tests
+
+Database tests run against the PostgreSQL database in TEST_DATABASE_URL (with the current
+schema, e.g. created by init_db.py) inside a transaction that is rolled back afterwards.
+They are skipped when TEST_DATABASE_URL is not set.
+"""
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    database_url = os.environ.get("TEST_DATABASE_URL")
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_engine(database_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    """Session whose writes are rolled back after the test (commits become savepoints)"""
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture
+def business(db):
+    """Admin user that owns the test data"""
+    from app import models
+    
+    user = models.User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="-", is_admin=True)
+    db.add(user)
+    db.flush()
+    return user
@@ -0,0 +1,24 @@
+"""
+Tests for the marketing broadcast request filters
+Run with: docker-compose exec backend python -m pytest tests
+"""
+from datetime import date
+
+from app.routers.marketing_emails import BroadcastFilters
+
+
+def test_custom_dates_accept_date_input_values():
+    # <input type="date"> sends plain YYYY-MM-DD strings
+    filters = BroadcastFilters.model_validate({
+        "date_filter": "custom",
+        "custom_start_date": "2026-01-01",
+        "custom_end_date": "2026-01-31",
+    })
+    assert filters.custom_start_date == date(2026, 1, 1)
+    assert filters.custom_end_date == date(2026, 1, 31)
+
+
+def test_custom_dates_are_optional():
+    filters = BroadcastFilters.model_validate({"date_filter": "last_month"})
+    assert filters.custom_start_date is None
+    assert filters.custom_end_date is None
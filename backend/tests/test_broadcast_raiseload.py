@@ -0,0 +1,53 @@
+"""
+Tests for the lazy-load guard on the default broadcast client query
+Run with: TEST_DATABASE_URL=... python -m pytest tests
+"""
+import uuid
+
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+
+from app import models
+from app.routers.marketing_emails import _default_broadcast_clients_query
+
+
+@pytest.fixture
+def loaded_client(db, business):
+    product = models.Product(
+        business_id=business.id,
+        name="Antivirus key",
+        cost_price=1.0,
+        selling_price=2.0,
+        yandex_purchase_link="https://market.yandex.ru/product/1",
+    )
+    db.add(models.Client(
+        business_id=business.id,
+        name="Buyer",
+        email=f"{uuid.uuid4().hex}@example.com",
+        purchased_products=[product],
+    ))
+    db.flush()
+    db.expunge_all()  # Load through the query's options, not the identity map
+    [client] = _default_broadcast_clients_query(db, business.id).all()
+    return client
+
+
+def test_planned_attributes_are_loaded(loaded_client):
+    assert loaded_client.name == "Buyer"
+    [product] = loaded_client.purchased_products
+    assert product.name == "Antivirus key"
+    assert product.yandex_purchase_link == "https://market.yandex.ru/product/1"
+
+
+def test_unplanned_relationship_access_raises(loaded_client):
+    [product] = loaded_client.purchased_products
+    with pytest.raises(InvalidRequestError):
+        product.clients_who_purchased
+
+
+def test_unplanned_column_access_raises(loaded_client):
+    with pytest.raises(InvalidRequestError):
+        loaded_client.order_ids
+    [product] = loaded_client.purchased_products
+    with pytest.raises(InvalidRequestError):
+        product.generated_keys
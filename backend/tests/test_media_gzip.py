@@ -0,0 +1,32 @@
+"""
+Tests for choosing the precompressed gzip copy of media files
+Run with: docker-compose exec backend python -m pytest tests
+"""
+import pytest
+
+from app.routers.media import _accepts_gzip
+
+
+@pytest.mark.parametrize("accept_encoding", [
+    "gzip",
+    "gzip, deflate, br",
+    "br;q=1.0, gzip;q=0.8",
+    "GZIP",
+    "*",
+    "deflate, *;q=0.5",
+])
+def test_accepts_gzip(accept_encoding):
+    assert _accepts_gzip(accept_encoding)
+
+
+@pytest.mark.parametrize("accept_encoding", [
+    "",
+    "identity",
+    "br, deflate",
+    "gzip;q=0",
+    "gzip; q=0.0, br",
+    "*;q=0",
+    "gzip;q=0, *",
+])
+def test_refuses_gzip(accept_encoding):
+    assert not _accepts_gzip(accept_encoding)
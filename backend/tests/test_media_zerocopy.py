@@ -0,0 +1,52 @@
+"""
+Tests for ZeroCopyFileResponse with and without the ASGI zero-copy send extension
+Run with: docker-compose exec backend python -m pytest tests
+"""
+import asyncio
+
+from app.routers.media import ZeroCopyFileResponse
+
+
+def _run(response, extensions):
+    """Call the response as an ASGI app and return the messages it sent"""
+    scope = {"type": "http", "method": "GET", "headers": [], "extensions": extensions}
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            # The file is only guaranteed to be open while send() runs
+            message = {**message, "content": message["file"].read()}
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    return messages
+
+
+def test_falls_back_to_file_response_without_extension(tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_bytes(b"hello media")
+
+    messages = _run(ZeroCopyFileResponse(str(path)), extensions={})
+
+    assert messages[0]["type"] == "http.response.start"
+    assert messages[0]["status"] == 200
+    assert all(message["type"] != "http.response.zerocopysend" for message in messages)
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    assert body == b"hello media"
+
+
+def test_sends_file_object_with_extension(tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_bytes(b"hello media")
+
+    messages = _run(ZeroCopyFileResponse(str(path)), extensions={"http.response.zerocopysend": {}})
+
+    assert [message["type"] for message in messages] == ["http.response.start", "http.response.zerocopysend"]
+    assert dict(messages[0]["headers"])[b"content-length"] == b"11"
+    zerocopy = messages[1]
+    assert zerocopy["more_body"] is False
+    assert zerocopy["content"] == b"hello media"
+    assert zerocopy["file"].closed  # Closed once the response has been sent
@@ -0,0 +1,67 @@
+"""
+Tests for the products list loading (query count and the RAISE_ON_LAZY_LOAD guard)
+Run with: TEST_DATABASE_URL=... python -m pytest tests
+"""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from app import models
+from app.config import settings
+from app.routers.products import get_products, _product_list_options
+
+
+@pytest.fixture(autouse=True)
+def raise_on_lazy_load(monkeypatch):
+    monkeypatch.setattr(settings, "RAISE_ON_LAZY_LOAD", True)
+
+
+@pytest.fixture
+def products(db, business):
+    db.add_all([
+        models.Product(
+            business_id=business.id,
+            name=f"Product {i}",
+            cost_price=1.0,
+            selling_price=2.0,
+            usage_period=30,
+            generated_keys=[{"key": f"KEY-{i}", "timestamp": "2026-01-01T00:00:00"}],
+        )
+        for i in range(5)
+    ])
+    db.flush()
+    db.expunge_all()  # Load through the list options, not the identity map
+
+
+@pytest.fixture
+def statements(db_engine):
+    """SQL statements executed while the test runs"""
+    executed = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    
+    event.listen(db_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(db_engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("search", [None, "key-3"])
+def test_products_list_runs_at_most_two_queries(db, business, products, statements, search):
+    response = get_products(
+        skip=0, limit=100, after_id=None, is_active=None, product_type=None, search=search,
+        current_user=business, db=db,
+    )
+    assert response.status_code == 200
+    assert len(statements) <= 2
+
+
+def test_column_outside_response_columns_raises(db, business, products):
+    product = db.query(models.Product).options(*_product_list_options()).filter(
+        models.Product.business_id == business.id
+    ).first()
+    assert product.name.startswith("Product ")
+    with pytest.raises(InvalidRequestError):
+        product.usage_period
+    with pytest.raises(InvalidRequestError):
+        product.clients_who_purchased
@@ -50,12 +50,25 @@ export interface BroadcastFilters {
 
 export interface BroadcastResponse {
   message: string
+  job_id: string
   sent_count: number
   template_id: number
   template_name: string
   filters_applied: string[]
 }
 
+export interface BroadcastJob {
+  id: string
+  template_id: number
+  status: 'queued' | 'running' | 'completed' | 'failed'
+  total_count: number
+  sent_count: number
+  failed_count: number
+  error?: string | null
+  created_at: string
+  finished_at?: string | null
+}
+
 export const marketingEmailsApi = {
   getAll: async (search?: string): Promise<MarketingEmailTemplate[]> => {
     const params = search ? { search } : {}
@@ -87,6 +100,11 @@ export const marketingEmailsApi = {
     return response.data
   },
 
+  getBroadcastJob: async (jobId: string): Promise<BroadcastJob> => {
+    const response = await apiClient.get(`marketing-emails/broadcasts/${jobId}`)
+    return response.data
+  },
+
   /** Export template as TXT or PDF; triggers browser download */
   export: async (id: number, format: 'txt' | 'pdf'): Promise<void> => {
     const response = await apiClient.get(`marketing-emails/${id}/export`, {
@@ -56,6 +56,13 @@ export interface ProductUpdate {
   yandex_field_updates?: Record<string, any>
 }
 
+export interface ProductSyncStatus {
+  product_id: number
+  state: 'pending' | 'synced' | 'failed' | 'not_synced'
+  is_synced: boolean
+  error?: string | null
+}
+
 export const productsApi = {
   getAll: async (params?: { is_active?: boolean; product_type?: string; search?: string }) => {
     const response = await apiClient.get<Product[]>('/products/', { params })
@@ -90,4 +97,10 @@ export const productsApi = {
     const response = await apiClient.get(`/products/${id}/full`)
     return response.data
   },
+
+  /** State of the Yandex push started by the last update (runs after the update returns) */
+  getSyncStatus: async (id: number): Promise<ProductSyncStatus> => {
+    const response = await apiClient.get<ProductSyncStatus>(`/products/${id}/sync-status`)
+    return response.data
+  },
 }
@@ -76,15 +76,39 @@ export default function MarketingEmails() {
     onError: () => alert('Upload failed. Only .txt or .pdf are allowed.'),
   })
 
+  // Broadcasts are sent in the background; poll the job until it has finished
+  const waitForBroadcast = async (jobId: string) => {
+    for (let attempt = 0; attempt < 150; attempt++) {
+      const job = await marketingEmailsApi.getBroadcastJob(jobId)
+      if (job.status === 'completed' || job.status === 'failed') return job
+      await new Promise(resolve => setTimeout(resolve, 2000))
+    }
+    return null
+  }
+
   const broadcastMutation = useMutation({
     mutationFn: ({ id, filters }: { id: number; filters: BroadcastFilters }) => 
       marketingEmailsApi.broadcast(id, filters),
-    onSuccess: (data) => {
+    onSuccess: async (data) => {
       const filterMsg = data.filters_applied && data.filters_applied.length > 0 
         ? ` (${data.filters_applied.join(', ')})` 
         : ''
-      showNotification('success', `Email broadcast sent to ${data.sent_count} client${data.sent_count !== 1 ? 's' : ''}!${filterMsg}`)
+      showNotification('success', `Email broadcast queued for ${data.sent_count} client${data.sent_count !== 1 ? 's' : ''}${filterMsg}, sending...`)
       resetFilters()
+      try {
+        const job = await waitForBroadcast(data.job_id)
+        if (job?.status === 'failed') {
+          showNotification('error', `Email broadcast failed: ${job.error || 'unknown error'}`)
+        } else if (job) {
+          const failedMsg = job.failed_count > 0 ? `, ${job.failed_count} failed` : ''
+          showNotification(
+            job.failed_count > 0 ? 'error' : 'success',
+            `Email broadcast sent to ${job.sent_count} client${job.sent_count !== 1 ? 's' : ''}${failedMsg}${filterMsg}`
+          )
+        }
+      } catch (error: any) {
+        showNotification('error', 'Could not check broadcast status: ' + (error?.response?.data?.detail || error.message))
+      }
     },
     onError: (error: any) => {
       const errorMessage = error?.response?.data?.detail || error?.message || 'Failed to send broadcast'
@@ -47,16 +47,43 @@ export default function Products() {
   })
   
 
+  // Yandex changes are pushed after the update returns - poll until the push has finished
+  const waitForYandexSync = async (id: number) => {
+    for (let attempt = 0; attempt < 30; attempt++) {
+      const syncStatus = await productsApi.getSyncStatus(id)
+      if (syncStatus.state !== 'pending') return syncStatus
+      await new Promise(resolve => setTimeout(resolve, 2000))
+    }
+    return null
+  }
+
   const updateProductMutation = useMutation({
     mutationFn: ({ id, data }: { id: number; data: ProductUpdate }) => productsApi.update(id, data),
-    onSuccess: (updatedProduct) => {
+    onSuccess: async (updatedProduct, { data }) => {
       queryClient.invalidateQueries({ queryKey: ['products'] })
       queryClient.invalidateQueries({ queryKey: ['product-full', viewingProduct?.id] })
       // Update viewingProduct state with the updated product data
       if (viewingProduct && viewingProduct.id === updatedProduct.id) {
         setViewingProduct(updatedProduct)
       }
-      showNotification('success', 'Product updated successfully on Yandex Market!')
+      const hasYandexUpdates = !!data.yandex_field_updates && Object.keys(data.yandex_field_updates).length > 0
+      if (!hasYandexUpdates || !updatedProduct.is_synced) {
+        showNotification('success', 'Product updated successfully!')
+        return
+      }
+      showNotification('success', 'Product saved, syncing with Yandex Market...')
+      try {
+        const syncStatus = await waitForYandexSync(updatedProduct.id)
+        queryClient.invalidateQueries({ queryKey: ['products'] })
+        queryClient.invalidateQueries({ queryKey: ['product-full', updatedProduct.id] })
+        if (syncStatus?.state === 'failed') {
+          showNotification('error', 'Product updated locally but failed to sync to Yandex: ' + (syncStatus.error || 'unknown error'))
+        } else if (syncStatus) {
+          showNotification('success', 'Product updated successfully on Yandex Market!')
+        }
+      } catch (error: any) {
+        showNotification('error', 'Could not check Yandex sync status: ' + (error?.response?.data?.detail || error.message))
+      }
     },
     onError: (error: any) => {
       showNotification('error', 'Failed to update product: ' + (error?.response?.data?.detail || error.message))